@@ -1,101 +1,146 @@
-import matplotlib.pyplot as plt
-import io
-import base64
-from functools import lru_cache
+import os
+import uuid
+import asyncio
 import logging
+from datetime import datetime
 import pandas as pd
 import numpy as np
 import random
-from ..core.portfolio import Portfolio
-from ..utils.helpers import calculate_esg_score
+from core.execution import run_off_loop
+from core.portfolio import Portfolio
+from core.optimizer import CLASS_CAPS, STRATEGY_METHODS, RISK_AVERSION, class_constraints, optimize_many
+from utils.helpers import calculate_esg_score, encode_stream
+from utils.graphics import renderer
 
 logger = logging.getLogger(__name__)
 
+REPORT_DIR = os.getenv('REPORT_DIR', 'reports')
+
+def _open_report(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return open(path, 'wb')
+
 class AnalysisAgent:
     def __init__(self, state):
         self.state = state
 
-    @lru_cache(maxsize=32)
     async def get_performance(self, params=None):
-        market_returns = self.state.market_data.mean(axis=1).pct_change().dropna()
         perf = {}
+        benchmark = self.state.benchmark_returns()
         for name, p in self.state.portfolios.items():
-            r = p.returns()
-            income = p.simulate_income()
-            attr = p.attribution()
+            a = self.state.analytics(name)
+            income = p.simulate_income(self.state.market_data)
+            attr = p.attribution(self.state.market_data, benchmark)
             perf[name] = {
-                'annual_return': r.mean() * 252,
-                'volatility': r.std() * np.sqrt(252),
-                'sharpe': (r.mean() / r.std()) * np.sqrt(252) if r.std() != 0 else 0,
-                'beta': p.beta(),
+                'annual_return': a['annual_return'],
+                'volatility': a['volatility'],
+                'sharpe': a['sharpe'],
+                'beta': a['beta'],
                 'income': income,
-                'drivers': {'market': r.mean() * 0.7, 'currency': random.uniform(-0.01, 0.01), 'income': income / p.value(self.state.market_data.index[-1])},
+                'drivers': {'market': a['annual_return'] / 252 * 0.7, 'currency': random.uniform(-0.01, 0.01), 'income': income / a['value']},
                 'attribution': attr,
                 'esg_score': calculate_esg_score(p)
             }
         return perf
 
     async def compare_portfolios(self, params=None):
-        df = pd.DataFrame(await self.get_performance(params)).T
-        if len(df) > 1:
+        df = pd.DataFrame(await self.state.delegate('analysis', 'get_performance', params)).T
+        if len(df) > 1 and logger.isEnabledFor(logging.DEBUG):
             diff = df.diff().iloc[1]
-            print(f"Performance Differences (P2 vs P1): Return {diff['annual_return']:.2%}, Volatility {diff['volatility']:.2%}")
-        print("Portfolio Comparison:\n", df)
+            logger.debug(f"Performance Differences (P2 vs P1): Return {diff['annual_return']:.2%}, Volatility {diff['volatility']:.2%}")
+            logger.debug(f"Portfolio Comparison:\n{df}")
         return df.to_string()
 
+    async def report_sections(self, params=None):
+        sections = [
+            ("Performance Metrics", self.state.delegate('analysis', 'compare_portfolios', params)),
+            ("Asset Allocation", self.state.delegate('analysis', 'get_asset_allocation', params)),
+            ("Macro Scenarios", self._scenarios_section()),
+            ("Concentration Risk", self.state.delegate('risk_scenario', 'get_concentration_risk'))
+        ]
+        tasks = [(title, asyncio.ensure_future(coro)) for title, coro in sections]
+        try:
+            yield f"Wealth Horizon Comprehensive Report\nDate: {datetime.now()}\n"
+            for title, task in tasks:
+                yield f"{title}:\n{await task}\n"
+        finally:
+            for _, task in tasks:
+                task.cancel()
+
+    async def _scenarios_section(self):
+        return str(self.state.scenarios)
+
+    async def stream_report(self, params=None):
+        params = params or {}
+        async for chunk in encode_stream(self.report_sections(params), params.get('gzip', False)):
+            yield chunk
+
     async def generate_report(self, params=None):
-        report = "Wealth Horizon Comprehensive Report\n"
-        report += f"Date: {datetime.now()}\n"
-        report += "Performance Metrics:\n" + await self.compare_portfolios(params) + "\n"
-        report += "Asset Allocation:\n" + str(await self.get_asset_allocation(params)) + "\n"
-        report += "Macro Scenarios:\n" + str(self.state.scenarios) + "\n"
-        report += "Concentration Risk:\n" + str(await self.delegate('risk_scenario', 'get_concentration_risk')) + "\n"
-        with open('comprehensive_report.txt', 'w') as f:
-            f.write(report)
-        return "Comprehensive report exported to comprehensive_report.txt"
+        params = params or {}
+        suffix = '.txt.gz' if params.get('gzip') else '.txt'
+        path = os.path.join(REPORT_DIR, f"report-{uuid.uuid4().hex}{suffix}")
+        f = await run_off_loop(_open_report, path)
+        try:
+            async for chunk in self.stream_report(params):
+                await run_off_loop(f.write, chunk)
+        finally:
+            await run_off_loop(f.close)
+        return f"Comprehensive report exported to {path}"
 
     async def get_holdings_cash(self, params=None):
         holdings_cash = {}
         for name, p in self.state.portfolios.items():
-            holdings_cash[name] = {'holdings': p.holdings, 'cash': p.cash}
+            holdings_cash[name] = {'holdings': p.holdings.to_dict(), 'cash': p.cash}
         return holdings_cash
 
     async def get_asset_allocation(self, params=None):
         allocations = {}
-        for name, p in self.state.portfolios.items():
-            alloc = {}
-            for asset, info in p.holdings.items():
-                class_ = self.state.asset_classes.get(asset, 'Other')
-                alloc[class_] = alloc.get(class_, 0) + (info['qty'] * self.state.market_data[asset].iloc[-1] / p.value(self.state.market_data.index[-1]))
-            allocations[name] = alloc
+        for name in self.state.portfolios:
+            allocations[name] = dict(self.state.analytics(name)['allocation'])
         return allocations
 
     async def optimize_portfolios(self, params=None):
-        for p in self.state.portfolios.values():
-            p.optimize_allocation()
+        params = params or {}
+        mu, cov = self.state.risk_model()
+        assets = list(mu.index)
+        C, caps = class_constraints(assets, self.state.asset_classes, params.get('class_caps', CLASS_CAPS))
+        groups = {}
+        for name, p in self.state.portfolios.items():
+            method = params.get('method') or STRATEGY_METHODS.get(p.strategy, 'min_variance')
+            groups.setdefault(method, []).append((name, p))
+        targets = {}
+        for method, group in groups.items():
+            weights = optimize_many(mu.to_numpy(), cov.to_numpy(), method, [RISK_AVERSION.get(p.strategy, 3.0) for _, p in group],
+                                    upper=params.get('max_weight', 1.0), C=C, caps=caps)
+            for (name, _), w in zip(group, weights):
+                targets[name] = dict(zip(assets, w))
+        with self.state.edit_many(targets) as drafts:
+            for name, draft in drafts.items():
+                draft.target_allocation = targets[name]
         return "Portfolios optimized with asset class constraints."
 
     async def create_graphic(self, params):
-        items = params.get('items', [])
-        fig, ax = plt.subplots(figsize=(12, 8))
+        items = tuple(tuple(item) for item in params.get('items', []))
+        fmt = params.get('format', 'png')
+        versions = tuple(self.state.portfolios[name].version for item_type, name in items
+                         if item_type == 'portfolio' and name in self.state.portfolios)
+        key = ('chart', items, fmt, self.state.data_version, versions)
+        cached = self.state.chart_cache.get(key)
+        if cached is not None:
+            return cached
+        series_dict = {}
         for item_type, name in items:
             label = f"{item_type.capitalize()} {name}"
             if item_type == 'portfolio':
                 p = self.state.portfolios.get(name)
                 if p:
-                    series = p.value_series() / p.value_series().iloc[0] * 100 if p.value_series().iloc[0] != 0 else pd.Series(100, index=self.state.market_data.index)
-                    ax.plot(series, label=label)
+                    values = p.value_series(self.state.market_data)
+                    first = values.iloc[0]
+                    series_dict[label] = values / first * 100 if first != 0 else pd.Series(100, index=self.state.market_data.index)
             elif item_type in ['stock', 'index']:
                 if name in self.state.market_data:
-                    series = self.state.market_data[name] / self.state.market_data[name].iloc[0] * 100
-                    ax.plot(series, label=label)
-        ax.legend()
-        ax.set_title("Performance Overlay Comparison (Normalized to 100)")
-        ax.set_xlabel("Date")
-        ax.set_ylabel("Performance (%)")
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png')
-        buf.seek(0)
-        img_base64 = base64.b64encode(buf.read()).decode('utf-8')
-        plt.close()
-        return f"data:image/png;base64,{img_base64}"
+                    series_dict[label] = self.state.market_data[name] / self.state.market_data[name].iloc[0] * 100
+        chart = await renderer.render(series_dict, fmt, title="Performance Overlay Comparison (Normalized to 100)",
+                                      xlabel="Date", ylabel="Performance (%)")
+        self.state.chart_cache.put(key, chart)
+        return chart
@@ -1,38 +1,66 @@
 import numpy as np
 import random
 import logging
+from core.scenarios import ScenarioEngine, DEFAULT_PATHS
 
 logger = logging.getLogger(__name__)
 
 class RiskAgent:
     def __init__(self, state):
         self.state = state
+        self._engine = None
+        self._engine_version = None
+
+    def scenario_engine(self):
+        if self._engine is None or self._engine_version != self.state.data_version:
+            self._engine = ScenarioEngine(self.state.market_data, self.state.returns())
+            self._engine_version = self.state.data_version
+        return self._engine
 
     async def analyze_scenario(self, params):
-        drop = params['drop']
+        requested = {'name': params.get('name', 'Requested shock'), 'impact': params['drop']}
+        scenarios = [requested] + list(self.state.scenarios)
+        names = list(self.state.portfolios.keys())
+        result = self.scenario_engine().run(
+            self.state.portfolios.values(), scenarios,
+            n_paths=params.get('paths', DEFAULT_PATHS), seed=params.get('seed'), chunk_size=params.get('chunk_size')
+        )
+        rng = random.Random(params.get('seed'))
+        esg = np.array([rng.uniform(0.5, 0.9) if 'climate' in s['name'].lower() else 1.0 for s in scenarios])
+        hedges = [s['hedge'] for s in self.state.scenarios]
         impacts = {}
-        for name, p in self.state.portfolios.items():
-            sim_returns = np.random.normal(p.returns().mean(), p.returns().std(), 5000) + drop * p.beta()
-            esg_score = random.uniform(0.5, 0.9) if 'climate' in params.get('name', '').lower() else 1.0
+        for i, name in enumerate(names):
             impacts[name] = {
-                'mean_impact': np.mean(sim_returns) * esg_score,
-                'var_95': np.percentile(sim_returns, 5),
-                'hedge_suggestion': random.choice([s['hedge'] for s in self.state.scenarios]),
-                'tax_optimization': 'Consider tax-loss harvesting if impact negative'
+                'mean_impact': result['mean_impact'][i, 0] * esg[0],
+                'var_95': result['var_95'][i, 0],
+                'cvar_95': result['cvar_95'][i, 0],
+                'hedge_suggestion': rng.choice(hedges) if hedges else None,
+                'tax_optimization': 'Consider tax-loss harvesting if impact negative',
+                'scenarios': {
+                    s['name']: {
+                        'mean_impact': result['mean_impact'][i, j] * esg[j],
+                        'var_95': result['var_95'][i, j],
+                        'cvar_95': result['cvar_95'][i, j]
+                    } for j, s in enumerate(scenarios[1:], start=1)
+                }
             }
         return impacts
 
     async def get_concentration_risk(self, params=None):
         risks = {}
-        for name, p in self.state.portfolios.items():
-            values = np.array([info['qty'] * self.state.market_data[asset].iloc[-1] for asset, info in p.holdings.items() if 'qty' in info])
-            weights = values / values.sum() if values.sum() != 0 else np.zeros_like(values)
-            hhi = np.sum(weights ** 2)
-            volatility = p.returns().std() * np.sqrt(252)
-            risks[name] = {'hhi': hhi, 'diversification_score': 1 - hhi, 'annual_volatility': volatility}
-        print("Concentration & Volatility Risks:", risks)
+        for name in self.state.portfolios:
+            a = self.state.analytics(name)
+            risks[name] = {'hhi': a['hhi'], 'diversification_score': 1 - a['hhi'], 'annual_volatility': a['volatility']}
+        logger.debug(f"Concentration & Volatility Risks: {risks}")
         return risks
 
+    async def get_rolling_metrics(self, params=None):
+        params = params or {}
+        try:
+            return self.state.rolling.report(params.get('metric', 'all'), params.get('windows'))
+        except ValueError as e:
+            return str(e)
+
     async def get_macro_scenarios(self, params=None):
         sorted_scenarios = sorted(self.state.scenarios, key=lambda x: x['prob'], reverse=True)
         return sorted_scenarios
@@ -1,15 +1,35 @@
+from utils.startup import import_timer, warmup, shutdown
+import_timer.install()
+
 from fastapi import FastAPI, Query, HTTPException, Depends
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.security import APIKeyHeader
+from pydantic import BaseModel
 import uvicorn
+import asyncio
+import json
 import os
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from core.coordinator import CoordinatorAgent
+from core.coordinator import BATCH_MAX_QUERIES, CoordinatorAgent
 from core.state import SharedState
 from core.portfolio import Portfolio
+from core.execution import run_off_loop
+from utils.metrics import REGISTRY, CounterFunc, Gauge, loop_monitor, recent_traces
 
 load_dotenv()
 
-app = FastAPI(title="Wealth Horizon AI")
+@asynccontextmanager
+async def lifespan(app):
+    loop_monitor.start()
+    app.state.warmup = asyncio.get_running_loop().run_in_executor(None, warmup, state.rl_memory, coord.registry.store)
+    try:
+        yield
+    finally:
+        loop_monitor.stop()
+        shutdown()
+
+app = FastAPI(title="Wealth Horizon AI", lifespan=lifespan)
 
 state = SharedState()
 coord = CoordinatorAgent(state)
@@ -21,7 +41,7 @@ p1 = Portfolio("EquityFocused", "Growth", {
     'GOLD': {'qty': 50, 'asset_class': 'Commodities', 'region': 'Global', 'currency': 'USD'},
     'PE_FUND': {'qty': 30, 'asset_class': 'Private Equity', 'region': 'US', 'currency': 'USD'},
     'REAL_ESTATE': {'qty': 20, 'asset_class': 'Real Estate', 'region': 'Europe', 'currency': 'EUR'},
-    'BTC': {'qty': 1, 'asset_class': 'Cryptocurrency', 'region': 'Global', 'currency': 'BTC'},
+    'BTC': {'qty': 1, 'asset_class': 'Cryptocurrency', 'region': 'Global', 'currency': 'USD'},
     'ART_COLLECTION': {'qty': 5, 'asset_class': 'Passion Assets', 'region': 'Global', 'currency': 'USD'}
 }, {'USD': 10000, 'EUR': 5000})
 p2 = Portfolio("BalancedAlt", "Diversified", {
@@ -34,6 +54,21 @@ p2 = Portfolio("BalancedAlt", "Diversified", {
 state.portfolios = {'P1': p1, 'P2': p2}
 state.hierarchy['holistic']['groups']['Family_Smith'] = {'individuals': {'Member_John': {'portfolios': [p1]}, 'Member_Jane': {'portfolios': [p2]}}}
 state.hierarchy['holistic']['groups']['Client_ABC_WealthMgr'] = {'individuals': {'Client_XYZ': {'portfolios': [p1, p2]}}}
+state.book.load({'P1': p1, 'P2': p2}, 'Family_Smith')
+state.book.load({'P1': p1, 'P2': p2}, 'Client_ABC_WealthMgr')
+if os.getenv('PORTFOLIO_FILE'):
+    state.book.load_file(os.getenv('PORTFOLIO_FILE'))
+state.instruments = {asset: {field: info[field] for field in ('asset_class', 'region', 'currency')}
+                     for p in state.portfolios.values() for asset, info in p.holdings.items()}
+state.asset_classes = {asset: info['asset_class'] for asset, info in state.instruments.items()}
+
+Gauge('wealth_analytics_cache_entries', 'Entries held in the analytics cache', lambda: state.analytics_cache.stats()['size'])
+CounterFunc('wealth_analytics_cache_lookups_total', 'Analytics cache lookups by result',
+            lambda: {('hit',): state.analytics_cache.hits, ('miss',): state.analytics_cache.misses}, ('result',))
+Gauge('wealth_analytics_cache_hit_ratio', 'Analytics cache hit ratio since start', lambda: state.analytics_cache.stats()['hit_rate'])
+CounterFunc('wealth_router_cache_lookups_total', 'Intent router parse cache lookups by result',
+            lambda: dict(zip([('hit',), ('miss',)], coord.router.parse.cache_info()[:2])), ('result',))
+Gauge('wealth_event_loop_max_lag_seconds', 'Largest event loop delay observed since start', lambda: loop_monitor.max_lag)
 
 API_KEY = os.getenv('API_KEY')
 
@@ -44,14 +79,88 @@ async def get_api_key(api_key: str = Depends(api_key_header)):
         raise HTTPException(status_code=403, detail="Invalid API Key")
     return api_key
 
+def check_client(client):
+    if client is not None and client not in state.book:
+        raise HTTPException(status_code=404, detail=f"Unknown client: {client}")
+    if client is None and state.book.ambiguous():
+        raise HTTPException(status_code=409, detail=f"Portfolios {sorted(state.book.ambiguous())} belong to several clients; pass a client")
+
 @app.get("/query")
-async def query_endpoint(text: str = Query(...), api_key: str = Depends(get_api_key)):
-    result = await coord.process_query(text)
+async def query_endpoint(text: str = Query(...), client: str | None = Query(None), api_key: str = Depends(get_api_key)):
+    check_client(client)
+    result = await coord.query(text, client)
     return {"result": result}
 
+class BatchQuery(BaseModel):
+    queries: list[str]
+    client: str | None = None
+
+@app.post("/query/batch")
+async def batch_query_endpoint(batch: BatchQuery, api_key: str = Depends(get_api_key)):
+    check_client(batch.client)
+    if len(batch.queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_QUERIES} queries per batch")
+    async def lines():
+        async for index, text, result, error in coord.process_batch(batch.queries, batch.client):
+            yield json.dumps({"index": index, "query": text, "result": result, "error": error}, default=str) + "\n"
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.get("/graphic")
+async def graphic_endpoint(text: str = Query(''), format: str = Query('png', pattern='^(png|svg|json)$'),
+                           client: str | None = Query(None), api_key: str = Depends(get_api_key)):
+    check_client(client)
+    params = coord.router.params(coord.router.parse(text)._replace(intent='graphic'))
+    with state.scope(client), coord.registry.request_scope():
+        result = await coord.delegate('analysis', 'create_graphic', {**params, 'format': format})
+    return {"result": result}
+
+async def scoped_stream(client, stream):
+    with state.scope(client), coord.registry.request_scope():
+        async for chunk in stream:
+            yield chunk
+
+@app.get("/report")
+async def report_endpoint(gzip: bool = Query(False), client: str | None = Query(None), api_key: str = Depends(get_api_key)):
+    check_client(client)
+    agent = coord.registry.get('analysis')
+    headers = {'Content-Encoding': 'gzip'} if gzip else {}
+    return StreamingResponse(scoped_stream(client, agent.stream_report({'gzip': gzip})), media_type='text/plain', headers=headers)
+
+async def rollup_response(client, *path):
+    check_client(client)
+    try:
+        with state.scope(client):
+            return await run_off_loop(state.rollups.rollup, ('holistic', *path))
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown hierarchy node: {'/'.join(path)}")
+
+@app.get("/rollup")
+async def rollup_endpoint(client: str | None = Query(None), api_key: str = Depends(get_api_key)):
+    return await rollup_response(client)
+
+@app.get("/rollup/{group}")
+async def group_rollup_endpoint(group: str, client: str | None = Query(None), api_key: str = Depends(get_api_key)):
+    return await rollup_response(client, group)
+
+@app.get("/rollup/{group}/{individual}")
+async def individual_rollup_endpoint(group: str, individual: str, client: str | None = Query(None), api_key: str = Depends(get_api_key)):
+    return await rollup_response(client, group, individual)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/traces")
+async def traces_endpoint(limit: int = Query(20, ge=1, le=256), api_key: str = Depends(get_api_key)):
+    return recent_traces(limit)
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/startup")
+async def startup_report(api_key: str = Depends(get_api_key)):
+    return import_timer.report()
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=int(os.getenv('PORT', 8000)))
@@ -0,0 +1,221 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+import logging
+
+logger = logging.getLogger(__name__)
+
+INDICES = ['SP500', 'DJIA']
+NAMED_ASSETS = ['AAPL', 'TSLA', 'BOND_US', 'GOLD', 'OIL', 'PE_FUND', 'REAL_ESTATE', 'BTC']
+ASSET_CLASSES = ['Equity', 'Fixed Income', 'Commodities', 'Private Equity', 'Real Estate', 'Cryptocurrency']
+REGIONS = ['US', 'Europe', 'Asia', 'Global']
+
+AGENT_CASES = [
+    ('analysis', 'get_performance', None),
+    ('analysis', 'get_asset_allocation', None),
+    ('analysis', 'create_graphic', {'items': [('portfolio', 'P1'), ('index', 'SP500')]}),
+    ('risk_scenario', 'analyze_scenario', {'drop': -0.05, 'seed': 0}),
+    ('risk_scenario', 'get_concentration_risk', None),
+    ('risk_scenario', 'get_rolling_metrics', None),
+    ('forecasting', 'forecast_returns', None),
+    ('trade', 'generate_ideas', None),
+    ('trade', 'autopilot_rebalance', None),
+    ('compliance', 'check_compliance', None)
+]
+
+INTENT_QUERIES = {
+    'performance': "performance",
+    'macro_scenarios': "macro scenarios",
+    'scenario': "scenario market drop 10%",
+    'trade_ideas': "trade ideas",
+    'report': "report",
+    'graphic_compare': "graphic compare portfolio p1 to sp500",
+    'compare': "compare portfolios",
+    'autopilot': "autopilot",
+    'forecast': "forecast",
+    'compliance': "compliance",
+    'optimize': "optimize",
+    'holdings': "holdings",
+    'asset_allocation': "asset allocation",
+    'concentration': "concentration",
+    'rolling_volatility': "rolling volatility 30 day",
+    'end_to_end': "full review"
+}
+
+def build_universe(n_assets, n_dates, seed=0):
+    from utils.market_data import EXCHANGE_RATES, synthetic_prices
+    names = INDICES + NAMED_ASSETS[:max(n_assets - len(INDICES), 0)]
+    names += [f"SYN{i:05d}" for i in range(n_assets - len(names))]
+    return synthetic_prices(names, n_dates, seed), dict(EXCHANGE_RATES)
+
+def install_universe(prices, exchange_rates):
+    import utils.market_data as market_data
+    market_data.install(prices)
+    market_data.exchange_rates = exchange_rates
+
+def build_book(state, n_portfolios, n_holdings, seed=0):
+    from core.portfolio import Portfolio
+    from utils.market_data import exchange_rates
+    rng = np.random.default_rng(seed)
+    universe = [c for c in state.market_data.columns if c not in INDICES]
+    currencies = list(exchange_rates)
+    state.asset_classes = {asset: ASSET_CLASSES[i % len(ASSET_CLASSES)] for i, asset in enumerate(universe)}
+    portfolios = {}
+    for i in range(n_portfolios):
+        chosen = rng.choice(universe, size=min(n_holdings, len(universe)), replace=False)
+        holdings = {asset: {'qty': float(rng.integers(1, 500)), 'asset_class': state.asset_classes[asset],
+                            'region': REGIONS[rng.integers(len(REGIONS))], 'currency': currencies[rng.integers(len(currencies))]}
+                    for asset in chosen}
+        cash = {currencies[rng.integers(len(currencies))]: float(rng.integers(1000, 100000))}
+        target = {asset: 1 / len(chosen) for asset in chosen}
+        portfolios[f"P{i + 1}"] = Portfolio(f"Portfolio{i + 1}", 'Growth' if i % 2 == 0 else 'Diversified', holdings, cash, target)
+    state.portfolios = portfolios
+    names = list(portfolios)
+    groups = state.hierarchy['holistic']['groups']
+    for g, start in enumerate(range(0, len(names), 4)):
+        members = names[start:start + 4]
+        groups[f"Group_{g}"] = {'individuals': {f"Member_{name}": {'portfolios': [portfolios[name]]} for name in members}}
+    groups['Advisor'] = {'individuals': {'Book': {'portfolios': list(portfolios.values())}}}
+    return portfolios
+
+def reset_caches(state):
+    state.analytics_cache.clear()
+    state.market_cache.clear()
+    state.chart_cache.clear()
+    state.fx.clear_cache()
+    state.rolling.invalidate()
+    state.market_data = state.market_data.copy(deep=False)
+
+def summarize(name, kind, mode, latencies, elapsed, peak_bytes):
+    latencies = np.asarray(latencies) * 1000
+    return {
+        'name': name,
+        'kind': kind,
+        'mode': mode,
+        'iterations': len(latencies),
+        'mean_ms': float(latencies.mean()),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'max_ms': float(latencies.max()),
+        'throughput_per_s': len(latencies) / elapsed if elapsed else 0.0,
+        'peak_memory_mb': peak_bytes / 2 ** 20
+    }
+
+async def measure(call, iterations, warmup, reset=None):
+    for _ in range(warmup):
+        await call()
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        if reset is not None:
+            reset()
+        t0 = time.perf_counter()
+        await call()
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    if reset is not None:
+        reset()
+    tracemalloc.start()
+    try:
+        await call()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return latencies, elapsed, peak
+
+async def run_benchmarks(args):
+    prices, exchange_rates = build_universe(args.assets, args.dates, args.seed)
+    install_universe(prices, exchange_rates)
+    from core.coordinator import CoordinatorAgent
+    from core.state import SharedState
+    state = SharedState(market_data=prices)
+    from utils.result_store import ResultStore
+    coord = CoordinatorAgent(state, ResultStore(args.result_store) if args.result_store else None)
+    build_book(state, args.portfolios, args.holdings, args.seed)
+    resets = {'cold': lambda: reset_caches(state), 'warm': None}
+    selected = set(args.only or [])
+    cases = []
+    for agent, method, params in AGENT_CASES:
+        async def call(agent=agent, method=method, params=params):
+            with coord.registry.request_scope():
+                return await coord.delegate(agent, method, dict(params) if params else None)
+        cases.append((f"{agent}.{method}", 'agent', call))
+    for intent, text in INTENT_QUERIES.items():
+        cases.append((f"intent.{intent}", 'intent', lambda text=text: coord.process_query(text)))
+    results = []
+    for name, kind, call in cases:
+        if selected and name not in selected:
+            continue
+        for mode in args.modes:
+            reset_caches(state)
+            results.append(summarize(name, kind, mode, *await measure(call, args.iterations, args.warmup, resets[mode])))
+            logger.info(f"{name} ({mode}): p50 {results[-1]['p50_ms']:.2f}ms p99 {results[-1]['p99_ms']:.2f}ms")
+    return results
+
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path) as f:
+        baseline = {(r['name'], r.get('mode', 'warm')): r for r in json.load(f)['results']}
+    regressions = []
+    for r in results:
+        before = baseline.get((r['name'], r['mode']))
+        if before and before['p50_ms'] > 0 and r['p50_ms'] > before['p50_ms'] * (1 + tolerance):
+            regressions.append({'name': r['name'], 'mode': r['mode'], 'baseline_p50_ms': before['p50_ms'], 'p50_ms': r['p50_ms'],
+                                'change': r['p50_ms'] / before['p50_ms'] - 1})
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark agent methods and coordinator intents on a synthetic book")
+    parser.add_argument('--assets', type=int, default=50)
+    parser.add_argument('--dates', type=int, default=756)
+    parser.add_argument('--portfolios', type=int, default=20)
+    parser.add_argument('--holdings', type=int, default=15)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--modes', nargs='+', choices=('cold', 'warm'), default=['cold', 'warm'],
+                        help="cold clears every cache before each iteration; warm times repeat calls against filled caches")
+    parser.add_argument('--result-store', help="read through this result store database; off by default so timings measure computation")
+    parser.add_argument('--only', nargs='*', help="benchmark names to run, e.g. analysis.get_performance intent.scenario")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help="previous results file to compare p50 latencies against")
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    args = parse_args(argv)
+    os.environ.setdefault('REPORT_DIR', tempfile.mkdtemp(prefix='bench-reports-'))
+    results = asyncio.run(run_benchmarks(args))
+    output = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'scale': {k: getattr(args, k) for k in ('assets', 'dates', 'portfolios', 'holdings')},
+            'iterations': args.iterations,
+            'modes': args.modes
+        },
+        'results': results
+    }
+    if args.baseline:
+        output['regressions'] = compare(results, args.baseline, args.tolerance)
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+    logger.info(f"Wrote {len(results)} benchmark results to {args.output}")
+    for r in output.get('regressions', []):
+        logger.warning(f"Regression in {r['name']} ({r['mode']}): p50 {r['baseline_p50_ms']:.2f}ms -> {r['p50_ms']:.2f}ms ({r['change']:+.0%})")
+    return 1 if output.get('regressions') else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+class AnalyticsCache:
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            flight = self._flights.setdefault(key, threading.Lock())
+        try:
+            with flight:
+                with self._lock:
+                    value = self._entries.get(key)
+                if value is None:
+                    value = compute()
+                    self.put(key, value)
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+        return value
+
+    def invalidate(self, *names):
+        names = set(names)
+        with self._lock:
+            for key in [k for k in self._entries if k[0] in names]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'size': len(self._entries), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0}
+
+def compute_analytics(state, portfolio):
+    market_data = state.market_data
+    r = portfolio.returns(market_data)
+    mean, std = r.mean(), r.std()
+    total = portfolio.value(market_data.index[-1], market_data)
+    values = portfolio.position_values(market_data)
+    weights = values / values.sum() if values.sum() != 0 else np.zeros_like(values)
+    hhi = np.sum(weights ** 2)
+    exposures = portfolio.exposures(values)
+    return {
+        'returns': r,
+        'annual_return': mean * 252,
+        'volatility': std * np.sqrt(252),
+        'sharpe': (mean / std) * np.sqrt(252) if std != 0 else 0,
+        'beta': portfolio.beta(market_data),
+        'hhi': hhi,
+        'allocation': {k: v / total for k, v in exposures['asset_class'].items()},
+        'region_exposure': {k: v / total for k, v in exposures['region'].items()},
+        'currency_exposure': {k: v / total for k, v in exposures['currency'].items()},
+        'value': total
+    }
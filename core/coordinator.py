@@ -1,17 +1,53 @@
-import random
-from datetime import datetime
+import os
+import asyncio
 from agents.analysis_agent import AnalysisAgent
 from agents.compliance_agent import ComplianceAgent
 from agents.forecasting_agent import ForecastingAgent
 from agents.research_agent import ResearchAgent
 from agents.risk_agent import RiskAgent
 from agents.trade_agent import TradeAgent
+from core.execution import ExecutionPlan, Step
+from core.registry import AgentRegistry
+from core.router import IntentRouter
+from utils.metrics import COALESCED, QUERY_SECONDS, profile_request, span
+from utils.result_store import MISSING
 import logging
 
 logger = logging.getLogger(__name__)
 
+CPU_BOUND = {
+    ('analysis', 'get_performance'),
+    ('analysis', 'compare_portfolios'),
+    ('analysis', 'get_asset_allocation'),
+    ('analysis', 'create_graphic'),
+    ('analysis', 'optimize_portfolios'),
+    ('forecasting', 'forecast_returns'),
+    ('risk_scenario', 'analyze_scenario'),
+    ('risk_scenario', 'get_concentration_risk'),
+    ('risk_scenario', 'get_rolling_metrics'),
+    ('trade', 'generate_ideas'),
+    ('trade', 'autopilot_rebalance')
+}
+
+PERFORMANCE_PLAN = ExecutionPlan([
+    Step('performance', 'analysis', 'get_performance'),
+    Step('critique', 'compliance', 'check_compliance')
+])
+
+MUTATING_INTENTS = {'execute_trade', 'autopilot', 'optimize'}
+
+BATCH_MAX_QUERIES = int(os.getenv('BATCH_MAX_QUERIES', 100))
+
+END_TO_END_PLAN = ExecutionPlan([
+    Step('market_data', 'research', 'get_market_data'),
+    Step('risk', 'risk_scenario', 'analyze_scenario', {'drop': -0.05}),
+    Step('forecasts', 'forecasting', 'forecast_returns', inputs={'market_data': 'market_data'}),
+    Step('perf', 'analysis', 'get_performance', inputs={'forecasts': 'forecasts'}),
+    Step('ideas', 'trade', 'generate_ideas', inputs={'risk': 'risk'})
+])
+
 class CoordinatorAgent:
-    def __init__(self, state):
+    def __init__(self, state, store=MISSING):
         self.state = state
         self.agents = {
             'analysis': AnalysisAgent,
@@ -21,67 +57,61 @@ class CoordinatorAgent:
             'risk_scenario': RiskAgent,
             'trade': TradeAgent
         }
+        self.registry = AgentRegistry(state, self.agents, CPU_BOUND, store)
+        self.router = IntentRouter.from_config(os.getenv('ROUTER_CONFIG'))
+        self._inflight = {}
 
-    async def process_query(self, query):
-        logger.info(f"Processing query: {query}")
-        query_lower = query.lower()
-        if 'performance' in query_lower:
-            perf = await self.delegate('analysis', 'get_performance')
-            critique = await self.delegate('compliance', 'check_compliance', {'perf': perf})
-            return {"performance": perf, "critique": critique}
-        elif 'scenario' in query_lower:
-            drop = -0.05 if '5%' in query_lower else -0.10
-            return await self.delegate('risk_scenario', 'analyze_scenario', {'drop': drop})
-        elif 'trade ideas' in query_lower:
-            return await self.delegate('trade', 'generate_ideas')
-        elif 'sell' in query_lower or 'buy' in query_lower:
-            return await self.delegate('trade', 'execute_trade', {'action': query})
-        elif 'report' in query_lower:
-            return await self.delegate('analysis', 'generate_report')
-        elif 'compare' in query_lower and not 'graphic' in query_lower:
-            return await self.delegate('analysis', 'compare_portfolios')
-        elif 'autopilot' in query_lower:
-            return await self.delegate('trade', 'autopilot_rebalance')
-        elif 'forecast' in query_lower:
-            return await self.delegate('forecasting', 'forecast_returns')
-        elif 'compliance' in query_lower:
-            return await self.delegate('compliance', 'check_compliance')
-        elif 'optimize' in query_lower:
-            return await self.delegate('analysis', 'optimize_portfolios')
-        elif 'holdings' in query_lower or 'cash' in query_lower:
-            return await self.delegate('analysis', 'get_holdings_cash')
-        elif 'asset allocation' in query_lower:
-            return await self.delegate('analysis', 'get_asset_allocation')
-        elif 'concentration' in query_lower or 'volatility' in query_lower:
-            return await self.delegate('risk_scenario', 'get_concentration_risk')
-        elif 'macro scenarios' in query_lower:
-            return await self.delegate('risk_scenario', 'get_macro_scenarios')
-        elif 'graphic' in query_lower or 'compare' in query_lower and ('portfolio' in query_lower or 'stock' in query_lower or 'index' in query_lower):
-            items = []
-            if 'portfolio abc' in query_lower or 'p1' in query_lower:
-                items.append(('portfolio', 'P1'))
-            if 'portfolio xyz' in query_lower or 'p2' in query_lower:
-                items.append(('portfolio', 'P2'))
-            if 's&p 500' in query_lower or 'sp500' in query_lower:
-                items.append(('index', 'SP500'))
-            if 'dow' in query_lower or 'djia' in query_lower:
-                items.append(('index', 'DJIA'))
-            if 'tesla' in query_lower or 'tsla' in query_lower:
-                items.append(('stock', 'TSLA'))
-            if 'apple' in query_lower or 'aapl' in query_lower:
-                items.append(('stock', 'AAPL'))
-            if not items:
-                items = [('portfolio', 'P1'), ('index', 'SP500')]
-            return await self.delegate('analysis', 'create_graphic', {'items': items})
+    async def query(self, text, client=None):
+        parsed = self.router.parse(text)
+        if parsed.intent in MUTATING_INTENTS:
+            return await self.process_query(text, client)
+        with self.state.scope(client):
+            key = (parsed.intent, parsed.entities, parsed.percents, parsed.windows, client, self.state.version())
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self.process_query(text, client))
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._inflight.pop(key, None) if self._inflight.get(key) is f else None)
         else:
-            market_data = await self.delegate('research', 'get_market_data')
-            forecasts = await self.delegate('forecasting', 'forecast_returns', {'market_data': market_data})
-            perf = await self.delegate('analysis', 'get_performance', {'forecasts': forecasts})
-            risk = await self.delegate('risk_scenario', 'analyze_scenario', {'drop': -0.05})
-            ideas = await self.delegate('trade', 'generate_ideas', {'risk': risk})
-            return f"End-to-end analysis: Performance {perf}, Forecasts {forecasts}, Risk {risk}, Ideas {ideas}"
+            COALESCED.inc()
+            logger.info(f"Coalesced query: {text}")
+        return await asyncio.shield(future)
+
+    async def process_batch(self, queries, client=None):
+        if len(queries) > BATCH_MAX_QUERIES:
+            raise ValueError(f"Batch of {len(queries)} queries exceeds the limit of {BATCH_MAX_QUERIES}")
+        async def run(index, text):
+            try:
+                return index, text, await self.query(text, client), None
+            except Exception as e:
+                logger.exception(f"Batch query failed: {text}")
+                return index, text, None, str(e)
+        reads, writes = [], []
+        for index, text in enumerate(queries):
+            (writes if self.router.parse(text).intent in MUTATING_INTENTS else reads).append((index, text))
+        with self.registry.request_scope():
+            for next_done in asyncio.as_completed([run(i, q) for i, q in reads]):
+                yield await next_done
+        for index, text in writes:
+            yield await run(index, text)
+
+    async def process_query(self, query, client=None):
+        logger.info(f"Processing query: {query}")
+        parsed = self.router.parse(query)
+        intent = parsed.intent or 'end_to_end'
+        with self.state.scope(client), self.registry.request_scope(), QUERY_SECONDS.time(intent=intent), \
+                span('query', query=query, intent=intent, client=client), profile_request(query):
+            return await self._dispatch(parsed)
+
+    async def _dispatch(self, parsed):
+        if parsed.intent == 'performance':
+            results, timings = await PERFORMANCE_PLAN.run(self.delegate)
+            return {"performance": results['performance'], "critique": results['critique'], "timings": timings}
+        elif parsed.intent is None:
+            r, timings = await END_TO_END_PLAN.run(self.delegate)
+            return f"End-to-end analysis: Performance {r['perf']}, Forecasts {r['forecasts']}, Risk {r['risk']}, Ideas {r['ideas']}, Timings {timings}"
+        intent = self.router.intents[parsed.intent]
+        return await self.delegate(intent.agent, intent.method, self.router.params(parsed))
 
     async def delegate(self, agent_name, method, params=None):
-        agent_class = self.agents[agent_name]
-        agent = agent_class(self.state)
-        return await getattr(agent, method)(params or {})
+        return await self.registry.delegate(agent_name, method, params)
@@ -0,0 +1,60 @@
+import asyncio
+import contextvars
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv('AGENT_WORKERS', os.cpu_count() or 4)), thread_name_prefix='agent')
+
+async def run_off_loop(fn, *args):
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, functools.partial(ctx.run, fn, *args))
+
+class Step:
+    def __init__(self, name, agent, method, params=None, inputs=None):
+        self.name = name
+        self.agent = agent
+        self.method = method
+        self.params = params or {}
+        self.inputs = inputs or {}
+
+class ExecutionPlan:
+    def __init__(self, steps=()):
+        self.steps = []
+        for step in steps:
+            self.add(step)
+
+    def add(self, step):
+        known = {s.name for s in self.steps}
+        missing = set(step.inputs.values()) - known
+        if missing:
+            raise ValueError(f"Step {step.name} depends on unknown steps: {sorted(missing)}")
+        self.steps.append(step)
+        return self
+
+    async def run(self, delegate):
+        results, timings, tasks = {}, {}, {}
+
+        async def run_step(step):
+            for dep in set(step.inputs.values()):
+                await tasks[dep]
+            params = dict(step.params)
+            params.update({key: results[dep] for key, dep in step.inputs.items()})
+            start = time.perf_counter()
+            results[step.name] = await delegate(step.agent, step.method, params)
+            timings[step.name] = time.perf_counter() - start
+
+        for step in self.steps:
+            tasks[step.name] = asyncio.ensure_future(run_step(step))
+        try:
+            await asyncio.gather(*tasks.values())
+        finally:
+            for task in tasks.values():
+                task.cancel()
+        logger.info("Plan timings: " + ", ".join(f"{name}={t * 1000:.1f}ms" for name, t in timings.items()))
+        return results, timings
@@ -0,0 +1,118 @@
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import logging
+from utils.market_data import exchange_rates
+
+logger = logging.getLogger(__name__)
+
+PIVOT = 'USD'
+
+def _index_key(index):
+    h = hashlib.blake2b(str(index.dtype).encode(), digest_size=16)
+    if isinstance(index, pd.DatetimeIndex):
+        h.update(index.asi8.tobytes())
+    else:
+        h.update(pd.util.hash_pandas_object(index, index=False).to_numpy().tobytes())
+    return h.digest()
+
+class FXEngine:
+    def __init__(self, cache_size=32):
+        self.version = 0
+        self.cache_size = cache_size
+        self._usd = {}
+        self._cache = {}
+        self._fingerprint = (None, None)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_static(cls, rates):
+        engine = cls()
+        for currency, rate in rates.items():
+            engine.set_rates(currency, rate)
+        return engine
+
+    def set_rates(self, currency, rates, quote=PIVOT):
+        if currency == PIVOT:
+            return
+        if not isinstance(rates, pd.Series):
+            rates = float(rates)
+        if quote != PIVOT:
+            quote_usd = self._usd.get(quote)
+            if quote_usd is None:
+                raise KeyError(f"Cannot triangulate {currency}/{quote}: no {quote}/{PIVOT} rates")
+            if isinstance(rates, pd.Series) and isinstance(quote_usd, pd.Series):
+                rates = rates * quote_usd.reindex(rates.index).ffill().bfill()
+            else:
+                rates = rates * quote_usd
+        if isinstance(rates, pd.Series):
+            rates = rates[~rates.index.duplicated(keep='last')].sort_index().astype(float)
+        with self._lock:
+            self._usd[currency] = rates
+            self._cache.clear()
+            self.version += 1
+
+    def fingerprint(self):
+        version, digest = self._fingerprint
+        if version != self.version:
+            h = hashlib.blake2b(digest_size=16)
+            for currency in sorted(self._usd):
+                rates = self._usd[currency]
+                h.update(currency.encode())
+                if isinstance(rates, pd.Series):
+                    h.update(pd.util.hash_pandas_object(rates).to_numpy().tobytes())
+                else:
+                    h.update(np.float64(rates).tobytes())
+            version, digest = self.version, h.hexdigest()
+            self._fingerprint = (version, digest)
+        return digest
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+
+    def known(self, currency):
+        return currency == PIVOT or currency in self._usd
+
+    def _usd_column(self, currency, index):
+        if currency == PIVOT:
+            return np.ones(len(index))
+        rates = self._usd.get(currency)
+        if rates is None:
+            raise KeyError(f"No FX rates for {currency}/{PIVOT}")
+        if not isinstance(rates, pd.Series):
+            return np.full(len(index), rates)
+        return rates.reindex(rates.index.union(index)).ffill().bfill().reindex(index).to_numpy(dtype=float)
+
+    def matrix(self, currencies, index, base=PIVOT):
+        currencies = tuple(currencies)
+        key = (currencies, _index_key(index), self.version)
+        with self._lock:
+            per_base = self._cache.setdefault(base, OrderedDict())
+            cached = per_base.get(key)
+            if cached is not None:
+                per_base.move_to_end(key)
+                return cached
+        usd = np.column_stack([self._usd_column(c, index) for c in currencies]) if currencies else np.empty((len(index), 0))
+        result = usd / self._usd_column(base, index)[:, None]
+        result.setflags(write=False)
+        with self._lock:
+            per_base = self._cache.setdefault(base, OrderedDict())
+            per_base[key] = result
+            while len(per_base) > self.cache_size:
+                per_base.popitem(last=False)
+        return result
+
+    def rates(self, currencies, date=None, base=PIVOT):
+        index = pd.DatetimeIndex([pd.Timestamp.max.normalize() if date is None else date])
+        return self.matrix(currencies, index, base)[0]
+
+    def rate(self, currency, date=None, base=PIVOT):
+        return float(self.rates((currency,), date, base)[0])
+
+    def convert(self, amount, currency, base=PIVOT, date=None):
+        return amount * self.rate(currency, date, base)
+
+fx = FXEngine.from_static(exchange_rates)
@@ -0,0 +1,170 @@
+from collections.abc import MutableMapping
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Categories:
+    def __init__(self):
+        self.codes = {}
+        self.labels = []
+
+    def code(self, label):
+        code = self.codes.get(label)
+        if code is None:
+            code = self.codes[label] = len(self.labels)
+            self.labels.append(label)
+        return code
+
+    def __len__(self):
+        return len(self.labels)
+
+ASSETS = Categories()
+CATEGORIES = {'asset_class': Categories(), 'region': Categories(), 'currency': Categories()}
+
+class HoldingView(MutableMapping):
+    def __init__(self, store, asset):
+        self._store = store
+        self._asset = asset
+
+    def __getitem__(self, key):
+        i = self._store._index[self._asset]
+        if key == 'qty':
+            return self._store._qty[i]
+        if key in CATEGORIES:
+            return CATEGORIES[key].labels[self._store._codes[key][i]]
+        return self._store._extras[self._asset][key]
+
+    def __setitem__(self, key, value):
+        i = self._store._index[self._asset]
+        if key == 'qty':
+            self._store._qty[i] = value
+        elif key in CATEGORIES:
+            self._store._codes[key][i] = CATEGORIES[key].code(value)
+        else:
+            self._store._extras[self._asset][key] = value
+        self._store.version += 1
+
+    def __delitem__(self, key):
+        del self._store._extras[self._asset][key]
+
+    def __iter__(self):
+        yield 'qty'
+        yield from CATEGORIES
+        yield from self._store._extras[self._asset]
+
+    def __len__(self):
+        return 1 + len(CATEGORIES) + len(self._store._extras[self._asset])
+
+    def __repr__(self):
+        return repr(dict(self))
+
+class HoldingsStore(MutableMapping):
+    def __init__(self, holdings=None, capacity=16):
+        self.version = 0
+        self._n = 0
+        self._index = {}
+        self._assets = []
+        self._extras = {}
+        self._qty = np.zeros(capacity, dtype=np.float64)
+        self._ids = np.zeros(capacity, dtype=np.int32)
+        self._codes = {field: np.zeros(capacity, dtype=np.int16) for field in CATEGORIES}
+        for asset, info in (holdings or {}).items():
+            self[asset] = info
+
+    def _grow(self):
+        capacity = max(2 * len(self._qty), 16)
+        self._qty = np.resize(self._qty, capacity)
+        self._ids = np.resize(self._ids, capacity)
+        self._codes = {field: np.resize(codes, capacity) for field, codes in self._codes.items()}
+
+    def __getitem__(self, asset):
+        if asset not in self._index:
+            raise KeyError(asset)
+        return HoldingView(self, asset)
+
+    def __setitem__(self, asset, info):
+        i = self._index.get(asset)
+        if i is None:
+            if self._n == len(self._qty):
+                self._grow()
+            i = self._index[asset] = self._n
+            self._assets.append(asset)
+            self._ids[i] = ASSETS.code(asset)
+            self._n += 1
+        self._qty[i] = info.get('qty', 0.0)
+        for field, categories in CATEGORIES.items():
+            self._codes[field][i] = categories.code(info.get(field, 'Other' if field != 'currency' else 'USD'))
+        self._extras[asset] = {k: v for k, v in info.items() if k != 'qty' and k not in CATEGORIES}
+        self.version += 1
+
+    def __delitem__(self, asset):
+        i = self._index.pop(asset)
+        last = self._n - 1
+        if i != last:
+            moved = self._assets[last]
+            self._qty[i], self._ids[i] = self._qty[last], self._ids[last]
+            for codes in self._codes.values():
+                codes[i] = codes[last]
+            self._assets[i] = moved
+            self._index[moved] = i
+        self._assets.pop()
+        del self._extras[asset]
+        self._n -= 1
+        self.version += 1
+
+    def __iter__(self):
+        return iter(list(self._assets))
+
+    def __len__(self):
+        return self._n
+
+    def __contains__(self, asset):
+        return asset in self._index
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+    def copy(self):
+        clone = HoldingsStore.__new__(HoldingsStore)
+        clone.version = self.version
+        clone._n = self._n
+        clone._index = dict(self._index)
+        clone._assets = list(self._assets)
+        clone._extras = {asset: dict(extras) for asset, extras in self._extras.items()}
+        clone._qty = self._qty.copy()
+        clone._ids = self._ids.copy()
+        clone._codes = {field: codes.copy() for field, codes in self._codes.items()}
+        return clone
+
+    def to_dict(self):
+        return {asset: dict(self[asset]) for asset in self._assets}
+
+    def adjust(self, asset, delta):
+        self._qty[self._index[asset]] += delta
+        self.version += 1
+
+    @property
+    def assets(self):
+        return list(self._assets)
+
+    @property
+    def qty(self):
+        return self._qty[:self._n]
+
+    @property
+    def asset_ids(self):
+        return self._ids[:self._n]
+
+    def codes(self, field):
+        return self._codes[field][:self._n]
+
+    def labels(self, field):
+        return CATEGORIES[field].labels
+
+    def exposure(self, field, values):
+        codes = self.codes(field)
+        size = len(CATEGORIES[field])
+        totals = np.bincount(codes, weights=values, minlength=size)
+        present = np.bincount(codes, minlength=size) > 0
+        return {CATEGORIES[field].labels[code]: totals[code] for code in np.flatnonzero(present)}
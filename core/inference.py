@@ -0,0 +1,38 @@
+import numpy as np
+import torch
+import logging
+from utils.ml_models import state_dim
+from utils.training import get_scheduler
+from utils.metrics import INFERENCE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+WINDOW = 10
+
+def return_windows(returns, assets, window=WINDOW):
+    tail = returns[assets].iloc[-window:]
+    if len(tail) < window:
+        return [], np.empty((0, window), dtype=np.float32)
+    valid = ~tail.isna().any().to_numpy()
+    kept = [asset for asset, ok in zip(assets, valid) if ok]
+    return kept, tail.to_numpy(dtype=np.float32)[:, valid].T.copy()
+
+def _forecast(state):
+    assets, windows = return_windows(state.returns(), list(state.asset_classes.keys()))
+    if not assets:
+        return {'assets': [], 'windows': windows, 'preds': np.empty(0, dtype=np.float32)}
+    with torch.inference_mode(), INFERENCE_SECONDS.time(model='predictor'):
+        preds = get_scheduler().model('predictor').predict_batch(torch.from_numpy(windows)).numpy()
+    return {'assets': assets, 'windows': windows, 'preds': preds}
+
+def batched_forecasts(state):
+    return state.market_cache.get_or_compute(('forecasts', state.data_version, get_scheduler().version), lambda: _forecast(state))
+
+def batched_q_values(windows, preds, beta):
+    n = len(preds)
+    features = np.zeros((n, state_dim), dtype=np.float32)
+    features[:, :WINDOW] = windows
+    features[:, WINDOW] = preds
+    features[:, WINDOW + 1] = beta
+    with torch.inference_mode(), INFERENCE_SECONDS.time(model='q_network'):
+        return get_scheduler().model('q_network')(torch.from_numpy(features)).numpy()
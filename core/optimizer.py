@@ -0,0 +1,112 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+METHODS = ('mean_variance', 'min_variance', 'risk_parity')
+CLASS_CAPS = {'Cryptocurrency': 0.15}
+STRATEGY_METHODS = {'Growth': 'mean_variance', 'Diversified': 'risk_parity'}
+RISK_AVERSION = {'Growth': 2.0, 'Diversified': 5.0}
+PARALLEL_MIN = int(os.getenv('OPTIMIZER_PARALLEL_MIN', 512))
+OPTIMIZER_WORKERS = int(os.getenv('OPTIMIZER_WORKERS', os.cpu_count() or 2))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def class_constraints(assets, asset_classes, caps=CLASS_CAPS):
+    names = list(caps)
+    C = np.array([[asset_classes.get(a, 'Other') == c for a in assets] for c in names], dtype=float).reshape(len(names), len(assets))
+    return C, np.array([caps[c] for c in names], dtype=float)
+
+def project_box_simplex(V, lower, upper, iters=60):
+    lo = (V - upper).min(axis=1)
+    hi = (V - lower).max(axis=1)
+    for _ in range(iters):
+        tau = (lo + hi) / 2
+        over = np.clip(V - tau[:, None], lower, upper).sum(axis=1) > 1
+        lo = np.where(over, tau, lo)
+        hi = np.where(over, hi, tau)
+    return np.clip(V - ((lo + hi) / 2)[:, None], lower, upper)
+
+def project(V, lower=0.0, upper=1.0, C=None, caps=None, rounds=20):
+    W = project_box_simplex(V, lower, upper)
+    if C is None or not len(caps):
+        return W
+    U = np.broadcast_to(upper, V.shape).astype(float)
+    free = 1 - C.sum(axis=0)
+    for _ in range(rounds):
+        sums = W @ C.T
+        over = sums > caps + 1e-9
+        if not over.any():
+            break
+        factor = np.where(over, caps / np.maximum(sums, 1e-12), 1.0) @ C + free
+        U = np.where(factor < 1, np.minimum(U, np.maximum(W * factor, lower)), U)
+        W = project_box_simplex(V, lower, U)
+    return W
+
+def risk_parity_weights(cov, iters=1000, tol=1e-10):
+    diag = np.maximum(np.diag(cov), 1e-12)
+    b = np.full(len(cov), 1 / len(cov))
+    y = 1 / np.sqrt(diag)
+    for _ in range(iters):
+        a = cov @ y - diag * y
+        y_new = (-a + np.sqrt(a ** 2 + 4 * diag * b)) / (2 * diag)
+        if np.abs(y_new - y).max() < tol:
+            y = y_new
+            break
+        y = y_new
+    return y / y.sum()
+
+def solve(mu, cov, method='mean_variance', risk_aversion=3.0, lower=0.0, upper=1.0, C=None, caps=None, iters=500, tol=1e-8):
+    if method not in METHODS:
+        raise ValueError(f"Unknown optimization method: {method}")
+    lam = np.atleast_1d(np.asarray(risk_aversion, dtype=float))
+    P, N = len(lam), len(mu)
+    if method == 'risk_parity':
+        return project(np.tile(risk_parity_weights(cov), (P, 1)), lower, upper, C, caps)
+    if method == 'min_variance' and P > 1:
+        return np.tile(solve(mu, cov, method, 1.0, lower, upper, C, caps, iters, tol), (P, 1))
+    L = max(np.linalg.eigvalsh(cov).max(), 1e-12)
+    W = project(np.full((P, N), 1 / N), lower, upper, C, caps)
+    for _ in range(iters):
+        if method == 'min_variance':
+            W_new = project(W - (W @ cov) / L, lower, upper, C, caps)
+        else:
+            W_new = project(W - (lam[:, None] * (W @ cov) - mu) / (lam[:, None] * L), lower, upper, C, caps)
+        done = np.abs(W_new - W).max() < tol
+        W = W_new
+        if done:
+            break
+    return W
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=OPTIMIZER_WORKERS)
+        return _pool
+
+def stop_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
+
+def optimize_many(mu, cov, method='mean_variance', risk_aversion=3.0, lower=0.0, upper=1.0, C=None, caps=None):
+    lam = np.atleast_1d(np.asarray(risk_aversion, dtype=float))
+    if len(lam) < PARALLEL_MIN or OPTIMIZER_WORKERS < 2:
+        return solve(mu, cov, method, lam, lower, upper, C, caps)
+    chunks = np.array_split(lam, OPTIMIZER_WORKERS)
+    try:
+        pool = get_pool()
+        futures = [pool.submit(solve, mu, cov, method, chunk, lower, upper, C, caps) for chunk in chunks if len(chunk)]
+        return np.vstack([f.result() for f in futures])
+    except BrokenProcessPool:
+        logger.warning("Optimizer pool broke; restarting it and solving in-process")
+        stop_pool()
+        return solve(mu, cov, method, lam, lower, upper, C, caps)
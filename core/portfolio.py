@@ -1,62 +1,110 @@
+import copy
+import hashlib
+import itertools
 import pandas as pd
 import numpy as np
 import random
 import logging
-from ..utils.ml_models import state_dim, action_dim
-from ..utils.ml_models import prices, dates, exchange_rates
+from utils.ml_models import state_dim, action_dim
+from utils.market_data import INDICES, default_assets
+from core.valuation import ValuationEngine
+from core.fx import PIVOT, fx
+from core.holdings import HoldingsStore
+from core.optimizer import CLASS_CAPS, class_constraints, solve
 
 logger = logging.getLogger(__name__)
 
+_uids = itertools.count(1)
+_versions = itertools.count(1)
+
 class Portfolio:
-    def __init__(self, name, strategy, holdings, cash, target_allocation=None):
+    def __init__(self, name, strategy, holdings, cash, target_allocation=None, base_currency=PIVOT):
+        self.uid = next(_uids)
         self.name = name
+        self.base_currency = base_currency
         self.strategy = strategy
-        self.holdings = holdings
+        self.holdings = HoldingsStore(holdings)
         self.cash = cash
         self.transactions = []
-        self.target_allocation = target_allocation or {asset: 1/len(assets) for asset in assets}
-
-    def value(self, date):
-        val = sum(self.cash.get(c, 0) * exchange_rates.get(c, 1.0) for c in self.cash)
-        for asset, info in self.holdings.items():
-            val += info['qty'] * prices[asset].loc[date] * exchange_rates.get(info['currency'], 1.0)
-        return val
-
-    def returns(self):
-        values = pd.Series([self.value(d) for d in dates if d in prices.index], index=[d for d in dates if d in prices.index])
-        return values.pct_change().dropna()
-
-    def value_series(self):
-        return pd.Series([self.value(d) for d in dates if d in prices.index], index=[d for d in dates if d in prices.index])
-
-    def beta(self):
-        market_returns = prices.mean(axis=1).pct_change().dropna()
-        port_returns = self.returns()
-        cov = port_returns.cov(market_returns)
-        var = market_returns.var()
-        return cov / var if var != 0 else 0
-
-    def simulate_income(self):
-        income = 0
-        for asset, info in self.holdings.items():
-            if info['asset_class'] in ['Equity', 'Fixed Income']:
-                income += info['qty'] * random.uniform(0.01, 0.05) * prices[asset].iloc[-1]
-            elif info['asset_class'] == 'Real Estate':
-                income += info['qty'] * random.uniform(0.04, 0.08) * prices[asset].iloc[-1]
-        return income
-
-    def attribution(self):
-        benchmark_returns = prices['SP500'].pct_change().dropna().mean()
-        port_returns = self.returns().mean()
+        self.version = next(_versions)
+        if target_allocation is None:
+            universe = default_assets()
+            target_allocation = {asset: 1/len(universe) for asset in universe}
+        self.target_allocation = target_allocation
+        self._engine = None
+        self._engine_key = None
+        self._valuation = None
+        self._valuation_key = None
+
+    def clone(self):
+        draft = copy.copy(self)
+        draft.holdings = self.holdings.copy()
+        draft.cash = dict(self.cash)
+        draft.transactions = list(self.transactions)
+        draft.target_allocation = dict(self.target_allocation)
+        draft.version = next(_versions)
+        return draft
+
+    def _holdings_key(self):
+        return (id(self.holdings), self.holdings.version, tuple(self.cash.items()), self.base_currency, fx.version)
+
+    def fingerprint(self):
+        h = hashlib.blake2b(digest_size=16)
+        h.update(repr((self.name, self.strategy, self.base_currency, sorted(self.cash.items()),
+                       sorted(self.target_allocation.items()), sorted(self.holdings.to_dict().items()))).encode())
+        return h.hexdigest()
+
+    def engine(self):
+        key = self._holdings_key()
+        if self._engine is None or self._engine_key != key:
+            self._engine = ValuationEngine(self.holdings, self.cash, self.base_currency)
+            self._engine_key = key
+        return self._engine
+
+    def valuation(self, market_data):
+        engine = self.engine()
+        key = (id(engine), id(market_data), market_data.shape, market_data.index[-1] if len(market_data) else None)
+        if self._valuation is None or self._valuation_key != key:
+            self._valuation = engine.evaluate(market_data)
+            self._valuation_key = key
+        return self._valuation
+
+    def value(self, date, market_data):
+        return self.engine().value_at(date, market_data)
+
+    def position_values(self, market_data):
+        return self.engine().positions_at(market_data.index[-1], market_data)
+
+    def returns(self, market_data):
+        return self.valuation(market_data).returns
+
+    def value_series(self, market_data):
+        return self.valuation(market_data).value_series
+
+    def beta(self, market_data):
+        return self.valuation(market_data).beta
+
+    def simulate_income(self, market_data):
+        labels = np.array(self.holdings.labels('asset_class'), dtype=object)[self.holdings.codes('asset_class')]
+        low = np.select([np.isin(labels, ['Equity', 'Fixed Income']), labels == 'Real Estate'], [0.01, 0.04], 0.0)
+        high = np.select([np.isin(labels, ['Equity', 'Fixed Income']), labels == 'Real Estate'], [0.05, 0.08], 0.0)
+        return float(np.sum(self.position_values(market_data) * np.random.uniform(low, high)))
+
+    def exposures(self, values):
+        return {field: self.holdings.exposure(field, values) for field in ('asset_class', 'region', 'currency')}
+
+    def attribution(self, market_data, benchmark_returns):
+        port_returns = self.returns(market_data).mean()
         allocation_effect = random.uniform(0, 0.02)
         selection_effect = port_returns - benchmark_returns
         return {'allocation': allocation_effect, 'selection': selection_effect, 'total': allocation_effect + selection_effect}
 
-    def optimize_allocation(self):
-        asset_returns = prices.pct_change().dropna().mean() * 252
-        cov = prices.pct_change().dropna().cov() * 252
-        weights = np.random.dirichlet(np.ones(len(assets)))
-        crypto_idx = [assets.index(a) for a in ['BTC', 'ETH'] if a in assets]
-        weights[crypto_idx] = np.minimum(weights[crypto_idx], 0.2)
-        weights /= weights.sum()
-        self.target_allocation = dict(zip(assets, weights))
+    def optimize_allocation(self, returns, method='mean_variance', asset_classes=None, class_caps=CLASS_CAPS, risk_aversion=3.0):
+        returns = returns.drop(columns=INDICES, errors='ignore').dropna()
+        asset_returns = returns.mean() * 252
+        cov = returns.cov() * 252
+        universe = list(returns.columns)
+        asset_classes = asset_classes or {asset: info['asset_class'] for asset, info in self.holdings.items()}
+        C, caps = class_constraints(universe, asset_classes, class_caps)
+        weights = solve(asset_returns.to_numpy(), cov.to_numpy(), method, risk_aversion, C=C, caps=caps)[0]
+        self.target_allocation = dict(zip(universe, weights))
@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+from types import MappingProxyType
+import logging
+from core.portfolio import Portfolio
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SHARD = 'default'
+
+class PortfolioRegistry:
+    def __init__(self):
+        self.version = 0
+        self._shards = {}
+        self._all = (None, None, None)
+        self._lock = threading.RLock()
+
+    def shards(self):
+        return list(self._shards)
+
+    def __contains__(self, shard):
+        return shard in self._shards
+
+    def count(self):
+        return sum(len(portfolios) for portfolios in self._shards.values())
+
+    def portfolios(self):
+        return list({p.uid: p for shard in list(self._shards.values()) for p in shard.values()}.values())
+
+    def _merge(self, shards):
+        merged, ambiguous = {}, set()
+        for portfolios in shards:
+            for name, p in portfolios.items():
+                if merged.setdefault(name, p) is not p:
+                    ambiguous.add(name)
+        return MappingProxyType(merged), frozenset(ambiguous)
+
+    def _merged(self):
+        version, merged, ambiguous = self._all
+        if version != self.version:
+            version = self.version
+            merged, ambiguous = self._merge(list(self._shards.values()))
+            self._all = (version, merged, ambiguous)
+        return merged, ambiguous
+
+    def ambiguous(self):
+        return self._merged()[1]
+
+    def view(self, shards=None):
+        if isinstance(shards, str):
+            return self._shards[shards]
+        merged, ambiguous = self._merged() if shards is None else self._merge([self._shards[s] for s in shards])
+        if ambiguous:
+            raise ValueError(f"Portfolios {sorted(ambiguous)} are held under the same name by several clients; scope the request to one client")
+        return merged
+
+    def _publish(self, updates):
+        for shard, portfolios in updates.items():
+            self._shards[shard] = MappingProxyType(portfolios)
+        self.version += 1
+
+    def holders(self, name, portfolio=None):
+        return [shard for shard, portfolios in self._shards.items()
+                if name in portfolios and (portfolio is None or portfolios[name] is portfolio)]
+
+    def load(self, portfolios, shard=DEFAULT_SHARD):
+        with self._lock:
+            current = dict(self._shards.get(shard, {}))
+            current.update(portfolios)
+            self._publish({shard: current})
+
+    def add(self, shard, name, portfolio):
+        self.load({name: portfolio}, shard)
+
+    def replace(self, portfolios, shard=DEFAULT_SHARD):
+        with self._lock:
+            self._shards.clear()
+            self._publish({shard: dict(portfolios)})
+
+    def remove(self, name, shard=None):
+        with self._lock:
+            shards = [shard] if shard is not None else self.holders(name)
+            self._publish({s: {k: v for k, v in self._shards[s].items() if k != name} for s in shards})
+
+    def _resolve(self, name, shard):
+        if shard is not None:
+            return self._shards[shard][name], [shard]
+        shards = self.holders(name)
+        if not shards:
+            raise KeyError(name)
+        current = self._shards[shards[0]][name]
+        if any(self._shards[s][name] is not current for s in shards):
+            raise ValueError(f"Portfolio {name!r} differs between clients {shards}; edit it within a client scope")
+        return current, shards
+
+    @contextmanager
+    def edit(self, name, shard=None):
+        with self.edit_many([name], shard) as drafts:
+            yield drafts[name]
+
+    @contextmanager
+    def edit_many(self, names, shard=None):
+        with self._lock:
+            resolved = {name: self._resolve(name, shard) for name in names}
+            drafts = {name: current.clone() for name, (current, _) in resolved.items()}
+            yield drafts
+            updates = {}
+            for name, (_, shards) in resolved.items():
+                for s in shards:
+                    updates.setdefault(s, dict(self._shards[s]))[name] = drafts[name]
+            self._publish(updates)
+
+    def load_file(self, path, shard_field='client'):
+        with open(path) as f:
+            if path.endswith('.jsonl') or path.endswith('.ndjson'):
+                records = (json.loads(line) for line in f if line.strip())
+            else:
+                data = json.load(f)
+                records = data if isinstance(data, list) else (
+                    dict(record, **{shard_field: shard, 'name': name})
+                    for shard, portfolios in data.items() for name, record in portfolios.items())
+            updates = {}
+            for record in records:
+                shard = record.get(shard_field, DEFAULT_SHARD)
+                holdings = record.get('holdings', {})
+                target = record.get('target_allocation') or {asset: 1 / len(holdings) for asset in holdings}
+                portfolio = Portfolio(record.get('display_name', record['name']), record.get('strategy', 'Diversified'),
+                                      holdings, dict(record.get('cash', {})), target, record.get('base_currency', 'USD'))
+                updates.setdefault(shard, {})[record['name']] = portfolio
+        with self._lock:
+            merged = {shard: {**self._shards.get(shard, {}), **portfolios} for shard, portfolios in updates.items()}
+            self._publish(merged)
+        count = sum(len(p) for p in updates.values())
+        logger.info(f"Loaded {count} portfolios into {len(updates)} shards from {os.path.basename(path)}")
+        return count
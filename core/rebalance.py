@@ -0,0 +1,49 @@
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+class RebalanceEngine:
+    def __init__(self, market_data):
+        self.assets = list(market_data.columns)
+        self.index = {asset: i for i, asset in enumerate(self.assets)}
+        self.last_prices = market_data.iloc[-1].to_numpy(dtype=float)
+
+    def snapshot(self, portfolio):
+        engine = portfolio.engine()
+        cols = np.array([self.index[a] for a in engine.assets], dtype=int)
+        fx = np.ones(len(self.assets))
+        fx[cols] = engine.fx
+        qty = np.zeros(len(self.assets))
+        np.add.at(qty, cols, engine.qty)
+        values = qty * self.last_prices * fx
+        return values, fx, values.sum() + engine.cash_value, engine.cash_value
+
+    def orders(self, portfolio, threshold=0.03, lot_size=1.0, liquidate=False):
+        values, fx, total, cash = self.snapshot(portfolio)
+        if total <= 0:
+            return []
+        target = np.zeros(len(self.assets))
+        targeted = np.zeros(len(self.assets), dtype=bool)
+        for asset, weight in portfolio.target_allocation.items():
+            if asset in self.index:
+                target[self.index[asset]] = weight
+                targeted[self.index[asset]] = True
+        drift = target - values / total
+        # Holdings missing from the target are only sold off when liquidation is requested
+        if not liquidate:
+            drift[~targeted] = 0.0
+        unit_value = self.last_prices * fx
+        qty = np.where((np.abs(drift) > threshold) & (unit_value > 0), drift * total / np.where(unit_value > 0, unit_value, 1), 0.0)
+        qty = np.trunc(qty / lot_size) * lot_size
+        notional = qty * unit_value
+        buys = notional > 0
+        budget = cash - notional[~buys].sum()
+        spend = notional[buys].sum()
+        if spend > budget:
+            scale = max(budget, 0) / spend
+            qty[buys] = np.floor(qty[buys] * scale / lot_size) * lot_size
+            notional = qty * unit_value
+        idx = np.flatnonzero(qty)
+        return [{'asset': self.assets[i], 'action': 'buy' if qty[i] > 0 else 'sell', 'qty': abs(qty[i]),
+                 'notional': abs(notional[i]), 'drift': drift[i]} for i in idx]
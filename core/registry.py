@@ -0,0 +1,149 @@
+import asyncio
+import contextvars
+import json
+from concurrent.futures import Future
+from contextlib import contextmanager
+import logging
+from core.execution import run_off_loop
+from utils.metrics import AGENT_ERRORS, AGENT_SECONDS, current_span, span
+from utils.result_store import MISSING, ResultStore
+
+logger = logging.getLogger(__name__)
+
+MEMOIZED = {
+    ('research', 'get_market_data'),
+    ('analysis', 'get_performance'),
+    ('analysis', 'compare_portfolios'),
+    ('analysis', 'get_asset_allocation'),
+    ('forecasting', 'forecast_returns'),
+    ('risk_scenario', 'get_concentration_risk'),
+    ('risk_scenario', 'get_rolling_metrics'),
+    ('risk_scenario', 'get_macro_scenarios')
+}
+
+PERSISTED = {
+    ('forecasting', 'forecast_returns'),
+    ('risk_scenario', 'analyze_scenario'),
+    ('risk_scenario', 'get_concentration_risk'),
+    ('risk_scenario', 'get_rolling_metrics')
+}
+
+SEEDED = {('risk_scenario', 'analyze_scenario')}
+
+MODEL_DEPENDENT = {('forecasting', 'forecast_returns')}
+
+_request_memo = contextvars.ContextVar('request_memo', default=None)
+_offloaded = contextvars.ContextVar('offloaded', default=False)
+
+def _memo_key(agent_name, method, params):
+    try:
+        return (agent_name, method, json.dumps(params, sort_keys=True, default=str))
+    except TypeError:
+        return None
+
+def _run_in_worker(coro):
+    _offloaded.set(True)
+    return asyncio.run(coro)
+
+class AgentRegistry:
+    def __init__(self, state, agent_classes, cpu_bound=(), store=MISSING):
+        self.state = state
+        self.cpu_bound = set(cpu_bound)
+        self.store = ResultStore.from_env() if store is MISSING else store
+        self.instances = {name: cls(state) for name, cls in agent_classes.items()}
+        state.registry = self
+
+    def get(self, agent_name):
+        return self.instances[agent_name]
+
+    @contextmanager
+    def request_scope(self):
+        token = _request_memo.set({}) if _request_memo.get() is None else None
+        try:
+            yield
+        finally:
+            if token is not None:
+                _request_memo.reset(token)
+
+    async def delegate(self, agent_name, method, params=None):
+        params = params or {}
+        memo = _request_memo.get()
+        key = _memo_key(agent_name, method, params) if memo is not None and (agent_name, method) in MEMOIZED else None
+        if key is None:
+            status = 'off'
+        else:
+            future = Future()
+            future.inline = _offloaded.get()
+            shared = memo.setdefault(key, future)
+            status = 'miss' if shared is future else 'hit'
+            # A pool worker must not block on an entry whose owner still needs a pool thread
+            if status == 'hit' and _offloaded.get() and not (shared.inline or shared.done()):
+                key, status = None, 'off'
+        with span(f"{agent_name}.{method}", memo=status) as s:
+            try:
+                if status == 'hit':
+                    result = await self._shared(shared, agent_name, method, params)
+                else:
+                    result = await self._call(agent_name, method, params)
+                    if key is not None:
+                        future.set_result(result)
+            except Exception as e:
+                if status == 'miss':
+                    memo.pop(key, None)
+                    future.set_exception(e)
+                AGENT_ERRORS.inc(agent=agent_name, method=method)
+                raise
+            except BaseException:
+                if status == 'miss':
+                    memo.pop(key, None)
+                    future.cancel()
+                raise
+        AGENT_SECONDS.observe(s.duration, agent=agent_name, method=method, memo=status)
+        return result
+
+    async def _shared(self, shared, agent_name, method, params):
+        try:
+            return await asyncio.wrap_future(shared)
+        except asyncio.CancelledError:
+            # The owner was cancelled rather than this caller; compute the result here instead
+            if not shared.cancelled() or asyncio.current_task().cancelling():
+                raise
+            return await self._call(agent_name, method, params)
+
+    def _store_key(self, agent_name, method, params):
+        key = _memo_key(agent_name, method, params)
+        if key is None:
+            return None
+        fingerprint = self.state.fingerprint()
+        if (agent_name, method) in MODEL_DEPENDENT:
+            from utils.training import get_scheduler
+            fingerprint = f"{fingerprint}:model-{get_scheduler().digest}"
+        return self.store.key(agent_name, method, key[2], fingerprint)
+
+    async def _persisted(self, agent_name, method, params):
+        fn = getattr(self.instances[agent_name], method)
+        key = self._store_key(agent_name, method, params)
+        if key is None:
+            return await fn(params)
+        result = self.store.get(key)
+        s = current_span()
+        if s is not None:
+            s.attrs['store'] = 'miss' if result is MISSING else 'hit'
+        if result is MISSING:
+            result = await fn(params)
+            self.store.put(key, result, agent_name, method)
+        return result
+
+    def _persistable(self, agent_name, method, params):
+        if self.store is None or (agent_name, method) not in PERSISTED:
+            return False
+        return (agent_name, method) not in SEEDED or params.get('seed') is not None
+
+    async def _call(self, agent_name, method, params):
+        if self._persistable(agent_name, method, params):
+            coro = self._persisted(agent_name, method, params)
+        else:
+            coro = getattr(self.instances[agent_name], method)(params)
+        if (agent_name, method) in self.cpu_bound and not _offloaded.get():
+            return await run_off_loop(_run_in_worker, coro)
+        return await coro
@@ -0,0 +1,285 @@
+import os
+import threading
+from collections import deque
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOWS = (30, 90, 252)
+PAIRWISE_MAX = int(os.getenv('ROLLING_PAIRWISE_MAX', 500))
+
+def _finite(value):
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+class RollingWindow:
+    def __init__(self, window, n, pairwise=False):
+        self.window = window
+        self.pairwise = pairwise
+        self.returns = np.zeros((window, n))
+        self.market = np.zeros(window)
+        self.levels = [deque() for _ in range(n)]
+        self.pos = 0
+        self.count = 0
+        self.s1 = np.zeros(n)
+        self.s2 = np.zeros(n)
+        self.sxm = np.zeros(n)
+        self.sm = 0.0
+        self.sm2 = 0.0
+        self.sxx = np.zeros((n, n)) if pairwise else None
+
+    def _rebase(self):
+        k = self.count
+        x, m = self.returns[:k], self.market[:k]
+        self.s1, self.s2, self.sxm = x.sum(axis=0), (x * x).sum(axis=0), m @ x
+        self.sm, self.sm2 = float(m.sum()), float(m @ m)
+        if self.pairwise:
+            self.sxx = x.T @ x
+
+    def push(self, t, x, m, levels):
+        if self.count == self.window:
+            old, old_m = self.returns[self.pos], self.market[self.pos]
+            self.s1 -= old
+            self.s2 -= old * old
+            self.sxm -= old * old_m
+            self.sm -= old_m
+            self.sm2 -= old_m * old_m
+            if self.pairwise:
+                self.sxx -= np.outer(old, old)
+        else:
+            self.count += 1
+        self.returns[self.pos], self.market[self.pos] = x, m
+        self.s1 += x
+        self.s2 += x * x
+        self.sxm += x * m
+        self.sm += m
+        self.sm2 += m * m
+        if self.pairwise:
+            self.sxx += np.outer(x, x)
+        self.pos = (self.pos + 1) % self.window
+        if self.pos == 0:
+            self._rebase()
+        for q, level in zip(self.levels, levels):
+            while q and q[-1][1] <= level:
+                q.pop()
+            q.append((t, level))
+            while q[0][0] <= t - self.window:
+                q.popleft()
+
+    def variance(self):
+        k = self.count
+        if k < 2:
+            return np.full(len(self.s1), np.nan)
+        return np.maximum(self.s2 - self.s1 * self.s1 / k, 0.0) / (k - 1)
+
+    def market_variance(self):
+        k = self.count
+        return max(self.sm2 - self.sm * self.sm / k, 0.0) / (k - 1) if k >= 2 else np.nan
+
+    def market_covariance(self):
+        k = self.count
+        return (self.sxm - self.s1 * self.sm / k) / (k - 1) if k >= 2 else np.full(len(self.s1), np.nan)
+
+    def covariance(self):
+        k = self.count
+        return (self.sxx - np.outer(self.s1, self.s1) / k) / (k - 1)
+
+    def peaks(self):
+        return np.array([q[0][1] for q in self.levels])
+
+class RollingStats:
+    def __init__(self, names, windows=DEFAULT_WINDOWS, pairwise=False):
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.windows = {w: RollingWindow(w, len(self.names), pairwise) for w in windows}
+        self.level = np.ones(len(self.names))
+        self.t = 0
+        self.last = None
+
+    def seed(self, returns, market, index=None):
+        returns = np.nan_to_num(np.asarray(returns, dtype=float))
+        market = np.nan_to_num(np.asarray(market, dtype=float))
+        tail = max(self.windows)
+        for x, m in zip(returns[-tail:], market[-tail:]):
+            self.update(x, m)
+        if index is not None and len(index):
+            self.last = index[-1]
+        return self
+
+    def update(self, x, m, timestamp=None):
+        x = np.nan_to_num(np.asarray(x, dtype=float))
+        m = float(np.nan_to_num(m))
+        self.level = self.level * (1 + x)
+        for window in self.windows.values():
+            window.push(self.t, x, m, self.level)
+        self.t += 1
+        if timestamp is not None:
+            self.last = timestamp
+
+    def volatility(self, window, annualize=252):
+        return np.sqrt(self.windows[window].variance() * annualize)
+
+    def beta(self, window):
+        w = self.windows[window]
+        var = w.market_variance()
+        return w.market_covariance() / var if var else np.full(len(self.names), np.nan)
+
+    def market_correlation(self, window):
+        w = self.windows[window]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return w.market_covariance() / np.sqrt(w.variance() * w.market_variance())
+
+    def correlation(self, window):
+        w = self.windows[window]
+        if not w.pairwise:
+            raise ValueError(f"Pairwise statistics are disabled for {len(self.names)} series")
+        std = np.sqrt(w.variance())
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return w.covariance() / np.outer(std, std)
+
+    def drawdown(self, window):
+        return self.level / self.windows[window].peaks() - 1
+
+    def metrics(self, window, names=None):
+        rows = [self.index[n] for n in names] if names is not None else range(len(self.names))
+        vol, beta, corr, dd = self.volatility(window), self.beta(window), self.market_correlation(window), self.drawdown(window)
+        return {self.names[i]: {'volatility': _finite(vol[i]), 'beta': _finite(beta[i]), 'market_correlation': _finite(corr[i]),
+                                'drawdown': _finite(dd[i])} for i in rows}
+
+class RollingEngine:
+    def __init__(self, state, windows=DEFAULT_WINDOWS):
+        self.state = state
+        self.windows = tuple(sorted(windows))
+        self.assets = None
+        self.portfolios = None
+        self._columns = None
+        self._book_version = None
+        self._matrix = None
+        self._lock = threading.Lock()
+
+    def _market(self, returns):
+        return returns.mean(axis=1)
+
+    def _portfolio_matrix(self, portfolios):
+        columns = {c: i for i, c in enumerate(self._columns)}
+        currencies = sorted({c for p in portfolios for c in p.engine().currencies} | {p.base_currency for p in portfolios})
+        codes = {c: k for k, c in enumerate(currencies)}
+        qty = np.zeros((len(currencies), len(portfolios), len(self._columns)))
+        cash = np.zeros((len(portfolios), len(currencies)))
+        base = np.array([codes[p.base_currency] for p in portfolios], dtype=np.int64)
+        for row, p in enumerate(portfolios):
+            engine = p.engine()
+            local = np.array([codes[c] for c in engine.currencies], dtype=np.int64)
+            cols = np.array([columns.get(a, -1) for a in engine.assets], dtype=np.int64)
+            known = cols >= 0
+            np.add.at(qty, (local[engine.codes[known]], row, cols[known]), engine.qty[known])
+            np.add.at(cash[row], local[engine.cash_codes], engine.cash_amounts)
+        return [p.uid for p in portfolios], (tuple(currencies), qty, cash, base)
+
+    def _values(self, frame, matrix):
+        currencies, qty, cash, base = matrix
+        usd = self.state.fx.matrix(currencies, frame.index)
+        held = (frame.to_numpy(dtype=float) @ qty.reshape(-1, qty.shape[2]).T).reshape(len(frame), *qty.shape[:2])
+        values = np.einsum('tkp,tk->tp', held, usd) + usd @ cash.T
+        return values / usd[:, base]
+
+    def _rebuild_assets(self):
+        data = self.state.market_data
+        self._columns = list(data.columns)
+        returns = data.pct_change().iloc[1:]
+        pairwise = len(self._columns) <= PAIRWISE_MAX
+        self.assets = RollingStats(self._columns, self.windows, pairwise).seed(returns.to_numpy(), self._market(returns).to_numpy(), returns.index)
+        self._book_version = None
+
+    def _version(self):
+        return (self.state.book.version, self.state.fx.version)
+
+    def _rebuild_portfolios(self):
+        uids, self._matrix = self._portfolio_matrix(self.state.book.portfolios())
+        tail = self.state.market_data.iloc[-(max(self.windows) + 1):]
+        values = self._values(tail, self._matrix)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = values[1:] / values[:-1] - 1
+        market = self._market(tail.pct_change().iloc[1:]).to_numpy()
+        self.portfolios = RollingStats(uids, self.windows).seed(returns, market, tail.index[1:])
+        self._book_version = self._version()
+
+    def refresh(self):
+        with self._lock:
+            data = self.state.market_data
+            if self.assets is None or list(data.columns) != self._columns or self.assets.last not in data.index:
+                self._rebuild_assets()
+            book_changed = self._book_version != self._version()
+            pos = data.index.get_loc(self.assets.last)
+            if pos < len(data) - 1:
+                window = data.iloc[pos:].to_numpy(dtype=float)
+                values = None if book_changed else self._values(data.iloc[pos:], self._matrix)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    for i in range(1, len(window)):
+                        x = window[i] / window[i - 1] - 1
+                        m = float(np.nanmean(x))
+                        self.assets.update(x, m, data.index[pos + i])
+                        if values is not None:
+                            self.portfolios.update(values[i] / values[i - 1] - 1, m, data.index[pos + i])
+                logger.debug(f"Rolling stats advanced by {len(window) - 1} bars")
+            if book_changed:
+                self._rebuild_portfolios()
+        return self
+
+    def invalidate(self):
+        with self._lock:
+            self.assets = None
+
+    def _validate(self, windows):
+        limit = len(self.state.market_data) - 1
+        invalid = [w for w in windows if not 2 <= w <= limit]
+        if invalid:
+            raise ValueError(f"Rolling windows must be between 2 and {limit} bars, got {invalid}")
+
+    def add_windows(self, windows):
+        self._validate(windows)
+        missing = [w for w in windows if w not in self.windows]
+        if missing:
+            with self._lock:
+                self.windows = tuple(sorted(set(self.windows) | set(missing)))
+                self.assets = None
+        return self.refresh()
+
+    def _adhoc(self, windows):
+        with self._lock:
+            columns, uids, matrix = self._columns, self.portfolios.names, self._matrix
+        tail = self.state.market_data.iloc[-(max(windows) + 1):]
+        returns = tail.pct_change().iloc[1:]
+        market = self._market(returns).to_numpy()
+        assets = RollingStats(columns, windows, len(columns) <= PAIRWISE_MAX).seed(returns.to_numpy(), market)
+        values = self._values(tail, matrix)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            portfolios = RollingStats(uids, windows).seed(values[1:] / values[:-1] - 1, market)
+        return assets, portfolios
+
+    def report(self, metric='all', windows=None, names=None):
+        windows = sorted(set(windows or self.windows))
+        self._validate(windows)
+        self.refresh()
+        sources = {w: (self.assets, self.portfolios) for w in windows if w in self.windows}
+        adhoc = [w for w in windows if w not in sources]
+        if adhoc:
+            logger.debug(f"Computing ad-hoc rolling windows {adhoc}")
+            sources.update(dict.fromkeys(adhoc, self._adhoc(adhoc)))
+        scope = self.state.portfolios
+        names = list(names) if names is not None else list(scope)
+        uids = {name: scope[name].uid for name in names if name in scope}
+        result = {}
+        for w in windows:
+            assets, stats = sources[w]
+            if metric == 'correlation':
+                corr = assets.correlation(w)
+                result[f"{w}d"] = {a: {b: _finite(round(c, 4)) for b, c in zip(assets.names, corr[i])} for i, a in enumerate(assets.names)}
+                continue
+            rows = stats.metrics(w, [uid for uid in uids.values() if uid in stats.index])
+            rows = {name: rows[uid] for name, uid in uids.items() if uid in rows}
+            if metric != 'all':
+                rows = {name: {metric: m[metric]} for name, m in rows.items()}
+            result[f"{w}d"] = rows
+        return result
@@ -0,0 +1,123 @@
+import threading
+import numpy as np
+import pandas as pd
+import logging
+from core.holdings import ASSETS
+
+logger = logging.getLogger(__name__)
+
+EXPOSURES = ('allocation', 'region_exposure', 'currency_exposure')
+
+class RollupEngine:
+    def __init__(self, state):
+        self.state = state
+        self.recomputed = 0
+        self._leaves = {}
+        self._nodes = {}
+        self._lock = threading.Lock()
+
+    def _names(self):
+        return {p.uid: name for name, p in self.state.portfolios.items()}
+
+    def _unique(self, portfolios, names, known):
+        seen = {}
+        for p in portfolios:
+            if p.uid not in names:
+                if p.uid not in known:
+                    logger.warning(f"Portfolio {p.name!r} in hierarchy is not registered in state.portfolios; skipped")
+                continue
+            seen.setdefault(names[p.uid], p)
+        return sorted(seen)
+
+    def tree(self):
+        names = self._names()
+        known = {p.uid for p in self.state.book.portfolios()}
+        clients = self.state.clients()
+        nodes = {}
+        holistic = []
+        for group, info in self.state.hierarchy['holistic']['groups'].items():
+            # Within a client scope, skip other clients' groups and branches without an in-scope portfolio
+            if clients is not None and group not in clients and group in self.state.book:
+                continue
+            members = []
+            for individual, person in info.get('individuals', {}).items():
+                leaves = self._unique(person.get('portfolios', []), names, known)
+                if clients is not None and not leaves:
+                    continue
+                nodes[('holistic', group, individual)] = leaves
+                members.extend(leaves)
+            if clients is not None and not members:
+                continue
+            nodes[('holistic', group)] = sorted(set(members))
+            holistic.extend(members)
+        nodes[('holistic',)] = sorted(set(holistic))
+        return nodes
+
+    def _leaf(self, name):
+        p = self.state.portfolios[name]
+        key = (p.version, self.state.data_version)
+        cached = self._leaves.get(name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        analytics = self.state.analytics(name)
+        positions = np.bincount(p.holdings.asset_ids, weights=p.position_values(self.state.market_data), minlength=len(ASSETS))
+        leaf = dict(analytics, positions=positions)
+        self._leaves[name] = (key, leaf)
+        return leaf
+
+    def _combine(self, leaves):
+        if not leaves:
+            return {'value': 0.0, 'portfolios': []}
+        data = [self._leaf(name) for name in leaves]
+        values = np.array([d['value'] for d in data], dtype=float)
+        total = values.sum()
+        w = values / total if total else np.full(len(values), 1 / len(values))
+        returns = pd.concat([d['returns'] for d in data], axis=1).fillna(0.0).to_numpy() @ w
+        mean, std = returns.mean(), returns.std(ddof=1) if len(returns) > 1 else 0.0
+        positions = np.zeros(len(ASSETS))
+        for d in data:
+            positions[:len(d['positions'])] += d['positions']
+        invested = positions.sum()
+        metrics = {
+            'value': total,
+            'annual_return': mean * 252,
+            'volatility': std * np.sqrt(252),
+            'sharpe': (mean / std) * np.sqrt(252) if std else 0,
+            'beta': float(np.dot(w, [d['beta'] for d in data])),
+            'hhi': float(np.sum((positions / invested) ** 2)) if invested else 0.0,
+            'portfolios': list(leaves)
+        }
+        for field in EXPOSURES:
+            combined = {}
+            for weight, d in zip(w, data):
+                for k, v in d[field].items():
+                    combined[k] = combined.get(k, 0.0) + weight * v
+            metrics[field] = combined
+        return metrics
+
+    def node(self, path, leaves=None):
+        path = tuple(path)
+        if leaves is None:
+            leaves = self.tree().get(path)
+            if leaves is None:
+                raise KeyError(path)
+        key = (self.state.data_version, tuple((name, self.state.portfolios[name].version) for name in leaves))
+        with self._lock:
+            cached = self._nodes.get(path)
+            if cached is not None and cached[0] == key:
+                return cached[1]
+            metrics = self._combine(leaves)
+            self._nodes[path] = (key, metrics)
+            self.recomputed += 1
+        return metrics
+
+    def rollup(self, path=('holistic',)):
+        path = tuple(path)
+        tree = self.tree()
+        if path not in tree:
+            raise KeyError(path)
+        result = {'path': list(path), **self.node(path, tree[path])}
+        children = {p[-1]: self.node(p, leaves) for p, leaves in tree.items() if len(p) == len(path) + 1 and p[:len(path)] == path}
+        if children:
+            result['children'] = children
+        return result
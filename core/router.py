@@ -0,0 +1,128 @@
+import json
+import re
+import threading
+from collections import namedtuple
+from functools import lru_cache
+import logging
+
+logger = logging.getLogger(__name__)
+
+Intent = namedtuple('Intent', ['name', 'keywords', 'priority', 'agent', 'method', 'params', 'requires'], defaults=(None, None))
+ParsedQuery = namedtuple('ParsedQuery', ['intent', 'entities', 'percents', 'text', 'windows'], defaults=((),))
+
+DEFAULT_INTENTS = [
+    Intent('performance', ('performance',), 10, None, None),
+    Intent('macro_scenarios', ('macro scenarios',), 15, 'risk_scenario', 'get_macro_scenarios'),
+    Intent('scenario', ('scenario',), 20, 'risk_scenario', 'analyze_scenario', 'shock'),
+    Intent('trade_ideas', ('trade ideas',), 30, 'trade', 'generate_ideas'),
+    Intent('execute_trade', ('sell', 'buy'), 40, 'trade', 'execute_trade', 'action'),
+    Intent('report', ('report',), 50, 'analysis', 'generate_report'),
+    Intent('graphic_compare', ('compare',), 55, 'analysis', 'create_graphic', 'items', ('entity', 'graphic')),
+    Intent('compare', ('compare',), 60, 'analysis', 'compare_portfolios'),
+    Intent('autopilot', ('autopilot',), 70, 'trade', 'autopilot_rebalance'),
+    Intent('forecast', ('forecast',), 80, 'forecasting', 'forecast_returns'),
+    Intent('compliance', ('compliance',), 90, 'compliance', 'check_compliance'),
+    Intent('optimize', ('optimize',), 100, 'analysis', 'optimize_portfolios'),
+    Intent('holdings', ('holdings', 'cash'), 110, 'analysis', 'get_holdings_cash'),
+    Intent('asset_allocation', ('asset allocation',), 120, 'analysis', 'get_asset_allocation'),
+    Intent('rolling_volatility', ('rolling volatility', 'rolling vol'), 124, 'risk_scenario', 'get_rolling_metrics', {'metric': 'volatility', 'windows': None}),
+    Intent('rolling_beta', ('rolling beta',), 125, 'risk_scenario', 'get_rolling_metrics', {'metric': 'beta', 'windows': None}),
+    Intent('rolling_correlation', ('rolling correlation', 'correlation'), 126, 'risk_scenario', 'get_rolling_metrics', {'metric': 'correlation', 'windows': None}),
+    Intent('drawdown', ('drawdown',), 127, 'risk_scenario', 'get_rolling_metrics', {'metric': 'drawdown', 'windows': None}),
+    Intent('rolling', ('rolling',), 128, 'risk_scenario', 'get_rolling_metrics', {'metric': 'all', 'windows': None}),
+    Intent('concentration', ('concentration', 'volatility'), 130, 'risk_scenario', 'get_concentration_risk'),
+    Intent('graphic', ('graphic', 'chart', 'plot'), 140, 'analysis', 'create_graphic', 'items')
+]
+
+DEFAULT_ENTITIES = {
+    'portfolio abc': ('portfolio', 'P1'), 'p1': ('portfolio', 'P1'),
+    'portfolio xyz': ('portfolio', 'P2'), 'p2': ('portfolio', 'P2'),
+    's&p 500': ('index', 'SP500'), 'sp500': ('index', 'SP500'),
+    'dow': ('index', 'DJIA'), 'djia': ('index', 'DJIA'),
+    'tesla': ('stock', 'TSLA'), 'tsla': ('stock', 'TSLA'),
+    'apple': ('stock', 'AAPL'), 'aapl': ('stock', 'AAPL')
+}
+
+DEFAULT_ITEMS = [('portfolio', 'P1'), ('index', 'SP500')]
+
+class IntentRouter:
+    def __init__(self, intents=DEFAULT_INTENTS, entities=DEFAULT_ENTITIES, cache_size=4096):
+        self.intents = {intent.name: intent for intent in intents}
+        self.entities = dict(entities)
+        self._lock = threading.Lock()
+        self.parse = lru_cache(maxsize=cache_size)(self._parse)
+        self._compile()
+
+    @classmethod
+    def from_config(cls, path=None):
+        router = cls()
+        if path:
+            router.load_config(path)
+        return router
+
+    def load_config(self, path):
+        with open(path) as f:
+            config = json.load(f)
+        for spec in config.get('intents', []):
+            self.add_intent(Intent(spec['name'], tuple(spec['keywords']), spec['priority'], spec.get('agent'),
+                                   spec.get('method'), spec.get('params'), tuple(spec['requires']) if spec.get('requires') else None))
+        for spec in config.get('entities', []):
+            self.add_entity(spec['alias'], spec['kind'], spec['value'])
+        logger.info(f"Loaded router config from {path}")
+
+    def add_intent(self, intent):
+        with self._lock:
+            self.intents[intent.name] = intent
+            self._compile()
+
+    def add_entity(self, alias, kind, value):
+        with self._lock:
+            self.entities[alias.lower()] = (kind, value)
+            self._compile()
+
+    def _compile(self):
+        tokens = {}
+        for intent in self.intents.values():
+            for keyword in intent.keywords:
+                tokens.setdefault(keyword.lower(), set()).add(intent.name)
+        for alias in self.entities:
+            tokens.setdefault(alias, set()).add('entity')
+        literals = sorted(tokens, key=len, reverse=True)
+        pattern = re.compile(r'(?P<pct>\d+(?:\.\d+)?)\s*%|(?P<window>\d+)\s*-?\s*(?:days?|d)\b|'
+                             r'(?<!\w)(?P<token>' + '|'.join(map(re.escape, literals)) + r')s?(?!\w)')
+        ranked = sorted(self.intents.values(), key=lambda intent: intent.priority)
+        self._compiled = (pattern, tokens, dict(self.entities), ranked)
+        self.parse.cache_clear()
+
+    def _parse(self, text):
+        pattern, tokens, entities, ranked = self._compiled
+        tags, found, percents, windows = set(), [], [], []
+        for m in pattern.finditer(text.lower()):
+            if m.group('pct') is not None:
+                percents.append(float(m.group('pct')))
+                continue
+            if m.group('window') is not None:
+                windows.append(int(m.group('window')))
+                continue
+            token = m.group('token')
+            tags |= tokens[token]
+            entity = entities.get(token)
+            if entity is not None and entity not in found:
+                found.append(entity)
+        for intent in ranked:
+            if intent.name in tags and (not intent.requires or tags.intersection(intent.requires)):
+                return ParsedQuery(intent.name, tuple(found), tuple(percents), text, tuple(windows))
+        return ParsedQuery(None, tuple(found), tuple(percents), text, tuple(windows))
+
+    def params(self, parsed):
+        intent = self.intents[parsed.intent]
+        if intent.params == 'shock':
+            return {'drop': -parsed.percents[0] / 100 if parsed.percents else -0.10}
+        if intent.params == 'action':
+            return {'action': parsed.text}
+        if intent.params == 'items':
+            return {'items': list(parsed.entities) or list(DEFAULT_ITEMS)}
+        params = dict(intent.params or {})
+        if 'windows' in params and parsed.windows:
+            params['windows'] = list(parsed.windows)
+        return params
@@ -0,0 +1,66 @@
+import os
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATHS = int(os.getenv('SCENARIO_PATHS', 5000))
+
+def covariance_factor(cov):
+    try:
+        return np.linalg.cholesky(cov)
+    except np.linalg.LinAlgError:
+        eigvals, eigvecs = np.linalg.eigh(cov)
+        return eigvecs * np.sqrt(np.clip(eigvals, 0, None))
+
+class ScenarioEngine:
+    def __init__(self, market_data, returns):
+        returns = returns.dropna()
+        self.assets = list(market_data.columns)
+        self.index = {asset: i for i, asset in enumerate(self.assets)}
+        self.last_prices = market_data.iloc[-1].to_numpy(dtype=float)
+        r = returns.to_numpy(dtype=float)
+        self.mu = r.mean(axis=0)
+        cov = np.atleast_2d(np.cov(r, rowvar=False))
+        self.factor = covariance_factor(cov)
+        market = r.mean(axis=1)
+        market_var = market.var(ddof=1)
+        centered = r - self.mu
+        self.asset_betas = (centered.T @ (market - market.mean())) / (len(r) - 1) / market_var if market_var else np.zeros(len(self.assets))
+
+    def weights(self, portfolios):
+        W = np.zeros((len(portfolios), len(self.assets)))
+        for row, p in enumerate(portfolios):
+            engine = p.engine()
+            cols = [self.index[a] for a in engine.assets]
+            values = engine.weights * self.last_prices[cols]
+            total = values.sum() + engine.cash_value
+            if total:
+                np.add.at(W[row], cols, values / total)
+        return W
+
+    def simulate(self, W, n_paths=DEFAULT_PATHS, seed=None, chunk_size=None):
+        rng = np.random.default_rng(seed)
+        chunk_size = chunk_size or n_paths
+        out = np.empty((n_paths, W.shape[0]))
+        for start in range(0, n_paths, chunk_size):
+            n = min(chunk_size, n_paths - start)
+            z = rng.standard_normal((n, len(self.assets)))
+            out[start:start + n] = (self.mu + z @ self.factor.T) @ W.T
+        return out
+
+    def run(self, portfolios, scenarios, n_paths=DEFAULT_PATHS, seed=None, chunk_size=None, alpha=0.05):
+        portfolios = list(portfolios)
+        W = self.weights(portfolios)
+        sims = self.simulate(W, n_paths, seed, chunk_size)
+        var = np.quantile(sims, alpha, axis=0)
+        tail = sims <= var
+        cvar = np.where(tail.any(axis=0), (sims * tail).sum(axis=0) / np.maximum(tail.sum(axis=0), 1), var)
+        mean = sims.mean(axis=0)
+        shocks = np.array([s['impact'] for s in scenarios], dtype=float)
+        shifts = (W @ self.asset_betas)[:, None] * shocks[None, :]
+        return {
+            'mean_impact': mean[:, None] + shifts,
+            'var_95': var[:, None] + shifts,
+            'cvar_95': cvar[:, None] + shifts
+        }
@@ -0,0 +1,176 @@
+import contextvars
+import hashlib
+import os
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+import logging
+from utils.ml_models import state_dim
+from utils.market_data import INDICES, default_prices, install
+from utils.price_store import PriceStore
+from utils.replay_buffer import ReplayBuffer, REPLAY_CAPACITY
+from core.analytics import AnalyticsCache, compute_analytics
+from core.rollup import RollupEngine
+from core.fx import fx
+from core.portfolio_registry import PortfolioRegistry
+from core.rolling import RollingEngine
+
+logger = logging.getLogger(__name__)
+
+PRICE_STORE_DIR = os.getenv('PRICE_STORE_DIR')
+ANALYTICS_CACHE_SIZE = int(os.getenv('ANALYTICS_CACHE_SIZE', 256))
+MARKET_CACHE_SIZE = int(os.getenv('MARKET_CACHE_SIZE', 16))
+CHART_CACHE_SIZE = int(os.getenv('CHART_CACHE_SIZE', 32))
+
+_portfolio_view = contextvars.ContextVar('portfolio_view', default=None)
+_scope_client = contextvars.ContextVar('scope_client', default=None)
+
+DEFAULT_SCENARIOS = [
+    {'name': 'Recession', 'prob': 0.25, 'impact': -0.15, 'hedge': 'Increase allocation to government bonds'},
+    {'name': 'Inflation Spike', 'prob': 0.30, 'impact': -0.08, 'hedge': 'Add commodities and inflation-linked bonds'},
+    {'name': 'Climate Transition', 'prob': 0.20, 'impact': -0.05, 'hedge': 'Tilt towards ESG leaders'},
+    {'name': 'Soft Landing', 'prob': 0.25, 'impact': 0.05, 'hedge': 'Maintain strategic allocation'}
+]
+
+class SharedState:
+    def __init__(self, market_data=None, cache_size=ANALYTICS_CACHE_SIZE, price_store_dir=PRICE_STORE_DIR, chart_cache_size=CHART_CACHE_SIZE,
+                 market_cache_size=MARKET_CACHE_SIZE):
+        self.book = PortfolioRegistry()
+        self.asset_classes = {}
+        self.instruments = {}
+        self.scenarios = list(DEFAULT_SCENARIOS)
+        self.hierarchy = {'holistic': {'groups': {}}}
+        self.rl_memory = ReplayBuffer(REPLAY_CAPACITY, state_dim)
+        self.data_version = 0
+        self.price_store = None
+        if price_store_dir:
+            self.price_store = self._open_store(price_store_dir, market_data)
+            market_data = self.price_store.frame()
+        elif market_data is None:
+            market_data = default_prices()
+        self._market_data = market_data
+        self.cache_size = cache_size
+        self.analytics_cache = AnalyticsCache(maxsize=cache_size)
+        self.market_cache = AnalyticsCache(maxsize=market_cache_size)
+        self.chart_cache = AnalyticsCache(maxsize=chart_cache_size)
+        self.rollups = RollupEngine(self)
+        self.fx = fx
+        self.rolling = RollingEngine(self)
+        self.registry = None
+
+    def _open_store(self, directory, market_data):
+        if not PriceStore.exists(directory):
+            return PriceStore.from_frame(directory, default_prices() if market_data is None else market_data)
+        store = PriceStore(directory)
+        if market_data is None:
+            install(store.frame())
+            logger.info(f"Loaded {store.length} bars from the price store at {directory}")
+        return store
+
+    @property
+    def portfolios(self):
+        view = _portfolio_view.get()
+        return view if view is not None else self.book.view()
+
+    @portfolios.setter
+    def portfolios(self, portfolios):
+        self.book.replace(portfolios)
+
+    @contextmanager
+    def scope(self, client=None):
+        self.refresh_market_data()
+        token = _portfolio_view.set(self.book.view(client))
+        client_token = _scope_client.set(client)
+        try:
+            yield
+        finally:
+            _scope_client.reset(client_token)
+            _portfolio_view.reset(token)
+
+    def clients(self):
+        client = _scope_client.get()
+        return None if client is None else {client} if isinstance(client, str) else set(client)
+
+    @contextmanager
+    def edit(self, name):
+        with self.edit_many([name]) as drafts:
+            yield drafts[name]
+
+    @contextmanager
+    def edit_many(self, names):
+        client = _scope_client.get()
+        with self.book.edit_many(names, client) as drafts:
+            yield drafts
+        self.analytics_cache.invalidate(*drafts)
+        if _portfolio_view.get() is not None:
+            _portfolio_view.set(self.book.view(client))
+
+    @property
+    def market_data(self):
+        return self._market_data
+
+    @market_data.setter
+    def market_data(self, data):
+        self._market_data = data
+        self.data_version += 1
+
+    def append_market_data(self, rows):
+        if self.price_store is not None:
+            self.price_store.append(rows)
+            self.market_data = self.price_store.frame()
+        else:
+            self.market_data = pd.concat([self._market_data, rows])
+
+    def refresh_market_data(self):
+        if self.price_store is not None:
+            length = self.price_store.length
+            self.price_store.refresh()
+            if self.price_store.length != length:
+                self.market_data = self.price_store.frame()
+
+    def returns(self, kind='simple'):
+        if self.price_store is not None:
+            return self.price_store.frame(f"{kind}_returns")
+        def compute():
+            if kind == 'log':
+                return np.log(self._market_data / self._market_data.shift(1))
+            return self._market_data.pct_change()
+        return self.market_cache.get_or_compute((f"{kind}_returns", self.data_version), compute)
+
+    async def delegate(self, agent_name, method, params=None):
+        return await self.registry.delegate(agent_name, method, params)
+
+    def version(self):
+        return (self.data_version, tuple((name, p.version) for name, p in self.portfolios.items()))
+
+    def fingerprint(self):
+        def market():
+            h = hashlib.blake2b(digest_size=16)
+            h.update(','.join(map(str, self._market_data.columns)).encode())
+            h.update(pd.util.hash_pandas_object(self._market_data).to_numpy().tobytes())
+            h.update(self.fx.fingerprint().encode())
+            return h.hexdigest()
+        def book():
+            h = hashlib.blake2b(self.market_cache.get_or_compute(('market_fingerprint', self.data_version), market).encode(), digest_size=16)
+            for name, p in sorted(self.portfolios.items()):
+                h.update(f"{name}={p.fingerprint()};".encode())
+            return h.hexdigest()
+        h = hashlib.blake2b(self.market_cache.get_or_compute(('fingerprint',) + self.version(), book).encode(), digest_size=16)
+        h.update(repr(self.scenarios).encode())
+        return h.hexdigest()
+
+    def benchmark_returns(self, benchmark='SP500'):
+        return self.market_cache.get_or_compute(('benchmark_returns', benchmark, self.data_version),
+                                                lambda: float(self.returns()[benchmark].dropna().mean()))
+
+    def risk_model(self):
+        def compute():
+            r = self.returns().drop(columns=INDICES, errors='ignore').dropna()
+            return r.mean() * 252, r.cov() * 252
+        return self.market_cache.get_or_compute(('risk_model', self.data_version), compute)
+
+    def analytics(self, name):
+        p = self.portfolios[name]
+        key = (name, p.version, self.data_version)
+        self.analytics_cache.maxsize = max(self.cache_size, self.book.count())
+        return self.analytics_cache.get_or_compute(key, lambda: compute_analytics(self, p))
@@ -0,0 +1,75 @@
+import pandas as pd
+import numpy as np
+import logging
+from core.holdings import CATEGORIES
+from core.fx import PIVOT, fx
+
+logger = logging.getLogger(__name__)
+
+_market_cache = {}
+
+def market_returns(market_data):
+    key = (id(market_data), market_data.shape, market_data.index[-1] if len(market_data.index) else None)
+    if key not in _market_cache:
+        _market_cache.clear()
+        _market_cache[key] = market_data.mean(axis=1).pct_change().dropna()
+    return _market_cache[key]
+
+class ValuationResult:
+    def __init__(self, index, values, market):
+        self.value_series = pd.Series(values, index=index)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rets = values[1:] / values[:-1] - 1
+        self.returns = pd.Series(rets, index=index[1:]).dropna()
+        self.beta = self._beta(market)
+
+    def _beta(self, market):
+        aligned = market.reindex(self.returns.index).to_numpy()
+        port = self.returns.to_numpy()
+        mask = ~np.isnan(aligned)
+        var = market.var()
+        if mask.sum() < 2 or var == 0:
+            return 0
+        x, y = port[mask], aligned[mask]
+        cov = np.dot(x - x.mean(), y - y.mean()) / (len(x) - 1)
+        return cov / var
+
+class ValuationEngine:
+    def __init__(self, holdings, cash, base=PIVOT):
+        self.base = base
+        self.assets = holdings.assets
+        self.qty = holdings.qty.copy()
+        codes = np.concatenate([holdings.codes('currency'), [CATEGORIES['currency'].code(c) for c in cash]]).astype(np.int64)
+        used, codes = np.unique(codes, return_inverse=True)
+        self.codes, self.cash_codes = codes[:len(self.assets)], codes[len(self.assets):]
+        self.cash_amounts = np.array(list(cash.values()), dtype=float)
+        self.currencies = tuple(CATEGORIES['currency'].labels[c] for c in used)
+        latest = fx.rates(self.currencies, base=base)
+        self.fx = latest[self.codes]
+        self.weights = self.qty * self.fx
+        self.cash_value = float(latest[self.cash_codes] @ self.cash_amounts)
+
+    def _values(self, index, matrix):
+        rates = fx.matrix(self.currencies, index, self.base)
+        return (matrix * rates[:, self.codes]) @ self.qty + rates[:, self.cash_codes] @ self.cash_amounts
+
+    def _columns(self, market_data):
+        cols = market_data.columns.get_indexer(self.assets)
+        if (cols < 0).any():
+            raise KeyError(f"No prices for {[a for a, c in zip(self.assets, cols) if c < 0]}")
+        return cols
+
+    def value_at(self, date, market_data):
+        row = market_data.index.get_loc(date)
+        index = market_data.index[row:row + 1]
+        matrix = market_data.to_numpy(dtype=float)[row:row + 1, self._columns(market_data)]
+        return float(self._values(index, matrix)[0])
+
+    def positions_at(self, date, market_data):
+        row = market_data.index.get_loc(date)
+        rates = fx.matrix(self.currencies, market_data.index[row:row + 1], self.base)[0]
+        return market_data.iloc[row].to_numpy(dtype=float)[self._columns(market_data)] * rates[self.codes] * self.qty
+
+    def evaluate(self, market_data):
+        matrix = market_data.to_numpy(dtype=float)[:, self._columns(market_data)]
+        return ValuationResult(market_data.index, self._values(market_data.index, matrix), market_returns(market_data))
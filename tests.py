@@ -1,19 +1,685 @@
+import asyncio
+import os
+import threading
+import time
 import unittest
+import tempfile
+import numpy as np
+import pandas as pd
 from core.coordinator import CoordinatorAgent
 from core.state import SharedState
+from core.analytics import AnalyticsCache
+from utils.graphics import downsample
+from utils.price_store import PriceStore
+from core.router import IntentRouter, Intent
+from core import optimizer
+from core.optimizer import METHODS, class_constraints, solve
+from core.holdings import HoldingsStore
+from core.rebalance import RebalanceEngine
+from agents.trade_agent import TradeAgent
+from utils.replay_buffer import ReplayBuffer
+from types import SimpleNamespace
+from unittest.mock import patch
+from core.portfolio import Portfolio
+from utils.metrics import QUERY_SECONDS, CounterFunc, Histogram, MetricsRegistry, span, traces
+from core.fx import FXEngine
+from core.portfolio_registry import PortfolioRegistry
+from core.rolling import RollingStats
+from utils.result_store import MISSING, ResultStore
+from core.registry import AgentRegistry
+from core.scenarios import ScenarioEngine
+from agents.risk_agent import RiskAgent
 
 class TestSystem(unittest.TestCase):
     def setUp(self):
-        self.state = SharedState()
-        self.coord = CoordinatorAgent(self.state)
+        self.state = SharedState(price_store_dir=None)
+        self.state.portfolios = {
+            'P1': Portfolio("EquityFocused", "Growth", {
+                'AAPL': {'qty': 100, 'asset_class': 'Equity', 'region': 'US', 'currency': 'USD'},
+                'BOND_US': {'qty': 200, 'asset_class': 'Fixed Income', 'region': 'US', 'currency': 'USD'},
+                'REAL_ESTATE': {'qty': 20, 'asset_class': 'Real Estate', 'region': 'Europe', 'currency': 'EUR'}
+            }, {'USD': 10000, 'EUR': 5000}),
+            'P2': Portfolio("BalancedAlt", "Diversified", {
+                'GOLD': {'qty': 50, 'asset_class': 'Commodities', 'region': 'Global', 'currency': 'USD'},
+                'ETH': {'qty': 10, 'asset_class': 'Cryptocurrency', 'region': 'Global', 'currency': 'USD'}
+            }, {'GBP': 8000})
+        }
+        self.state.asset_classes = {asset: info['asset_class'] for p in self.state.portfolios.values() for asset, info in p.holdings.items()}
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.coord = CoordinatorAgent(self.state, ResultStore(f"{tmp.name}/results.db"))
 
     def test_performance(self):
-        perf = self.coord.process_query("performance")
-        self.assertIsInstance(perf, dict)
+        perf = asyncio.run(self.coord.process_query("performance"))
+        self.assertEqual(set(perf['performance']), {'P1', 'P2'})
+        for metrics in perf['performance'].values():
+            self.assertTrue(np.isfinite([metrics['annual_return'], metrics['volatility'], metrics['sharpe']]).all())
+        self.assertGreater(perf['performance']['P1']['income'], 0)
 
     def test_graphic(self):
-        graphic = self.coord.process_query("graphic compare portfolio p1 to sp500")
+        graphic = asyncio.run(self.coord.process_query("graphic compare portfolio p1 to sp500"))
         self.assertIn("data:image/png;base64", graphic)
+        svg = asyncio.run(self.coord.delegate('analysis', 'create_graphic', {'items': [('index', 'SP500')], 'format': 'svg'}))
+        self.assertTrue(svg.lstrip().startswith('<?xml'))
+        self.assertEqual(self.state.chart_cache.stats()['size'], 2)
+        self.assertFalse(any(key[0] == 'chart' for key in self.state.analytics_cache._entries))
+
+    def test_failed_queries_are_timed(self):
+        before = QUERY_SECONDS.count(intent='holdings')
+        with patch.object(self.coord, '_dispatch', side_effect=RuntimeError('boom')), self.assertRaises(RuntimeError):
+            asyncio.run(self.coord.process_query("holdings"))
+        self.assertEqual(QUERY_SECONDS.count(intent='holdings'), before + 1)
+
+    def test_trade_ideas_without_portfolios(self):
+        coord = CoordinatorAgent(SharedState(price_store_dir=None), None)
+        ideas = asyncio.run(coord.delegate('trade', 'generate_ideas'))
+        self.assertEqual(ideas, ["No portfolios to generate trade ideas for."])
+        message = asyncio.run(coord.delegate('trade', 'execute_trade', {'action': "sell half of apple"}))
+        self.assertEqual(message, "No portfolios to execute trades for.")
+
+    def test_report_export(self):
+        with tempfile.TemporaryDirectory() as directory, patch('agents.analysis_agent.REPORT_DIR', f"{directory}/reports"):
+            message = asyncio.run(self.coord.process_query("export a report"))
+            path = message.rsplit(' ', 1)[-1]
+            with open(path) as f:
+                self.assertIn("Concentration Risk:", f.read())
+
+    def test_batch_shares_memo_and_runs_writes_after_reads(self):
+        calls = []
+        call = self.coord.registry._call
+        async def spy(agent_name, method, params):
+            calls.append(method)
+            return await call(agent_name, method, params)
+        self.coord.registry._call = spy
+        async def collect(queries):
+            return [index async for index, _, _, _ in self.coord.process_batch(queries)]
+        order = asyncio.run(collect(["optimize", "performance", "concentration risk"]))
+        self.assertEqual(order[-1], 0)
+        self.assertEqual(calls.count('get_concentration_risk'), 1)
+        self.assertLess(calls.index('check_compliance'), calls.index('optimize_portfolios'))
+        with patch('core.coordinator.BATCH_MAX_QUERIES', 2), self.assertRaises(ValueError):
+            asyncio.run(collect(["performance"] * 3))
+
+class TestCharts(unittest.TestCase):
+    def test_downsample_skips_all_nan_buckets(self):
+        values = np.arange(40, dtype=float)
+        values[:10] = np.nan
+        kept = downsample(pd.Series(values), max_points=8)
+        self.assertFalse(kept.isna().any())
+        self.assertEqual((kept.index.min(), kept.index.max()), (10, 39))
+
+class TestAnalyticsCache(unittest.TestCase):
+    def test_lru_eviction_and_counters(self):
+        cache = AnalyticsCache(maxsize=2)
+        cache.put(('P1', 0, 0), {'hhi': 0.1})
+        cache.put(('P2', 0, 0), {'hhi': 0.2})
+        self.assertEqual(cache.get(('P1', 0, 0)), {'hhi': 0.1})
+        cache.put(('P1', 1, 0), {'hhi': 0.3})
+        self.assertIsNone(cache.get(('P2', 0, 0)))
+        cache.invalidate('P1')
+        self.assertEqual(cache.stats()['size'], 0)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_concurrent_misses_compute_once(self):
+        cache, calls, release = AnalyticsCache(), [], threading.Event()
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            return {'hhi': 0.5}
+        threads = [threading.Thread(target=cache.get_or_compute, args=(('P1', 0, 0), compute)) for _ in range(4)]
+        for t in threads:
+            t.start()
+        while not calls:
+            time.sleep(0.01)
+        time.sleep(0.05)
+        release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.get(('P1', 0, 0)), {'hhi': 0.5})
+
+    def test_cache_scales_with_book_and_keeps_market_entries_apart(self):
+        state = SharedState(cache_size=2, price_store_dir=None)
+        state.portfolios = {f"P{i}": Portfolio(f"P{i}", "Growth", {'AAPL': {'qty': i + 1, 'asset_class': 'Equity', 'region': 'US', 'currency': 'USD'}},
+                                               {'USD': 100.0}, {'AAPL': 1.0}) for i in range(5)}
+        state.risk_model()
+        for _ in range(2):
+            for name in state.portfolios:
+                state.analytics(name)
+        self.assertEqual((state.analytics_cache.hits, state.analytics_cache.misses), (5, 5))
+        self.assertEqual(state.analytics_cache.stats()['maxsize'], 5)
+        self.assertTrue(all(key[0] in state.portfolios for key in state.analytics_cache._entries))
+        self.assertIn(('risk_model', state.data_version), state.market_cache._entries)
+
+class TestPriceStore(unittest.TestCase):
+    def test_incremental_append_matches_full_recompute(self):
+        index = pd.date_range('2024-01-01', periods=6)
+        frame = pd.DataFrame({'AAPL': [100, 101, 99, 102, 104, 103.0], 'GOLD': [50, 50.5, 51, 50, 49, 49.5]}, index=index)
+        with tempfile.TemporaryDirectory() as directory:
+            store = PriceStore(directory, columns=frame.columns, capacity=2)
+            store.append(frame.iloc[:3])
+            store.append(frame.iloc[3:])
+            np.testing.assert_allclose(store.view('simple_returns')[1:], frame.pct_change().to_numpy()[1:])
+            np.testing.assert_allclose(store.view('log_returns')[1:], np.log(frame / frame.shift(1)).to_numpy()[1:])
+            reopened = PriceStore(directory)
+            pd.testing.assert_frame_equal(reopened.frame(), frame, check_freq=False, check_index_type=False)
+
+    def test_analytics_follow_appended_bars(self):
+        index = pd.bdate_range('2024-01-01', periods=5)
+        frame = pd.DataFrame({'AAPL': [100, 101, 99, 102, 104.0], 'GOLD': [50, 50.5, 51, 50, 49.0]}, index=index)
+        bar = pd.DataFrame({'AAPL': [110.0], 'GOLD': [48.0]}, index=[index[-1] + pd.offsets.BDay()])
+        with tempfile.TemporaryDirectory() as directory:
+            state = SharedState(market_data=frame, price_store_dir=directory)
+            state.portfolios = {'P1': Portfolio("Mixed", "Growth", {'AAPL': {'qty': 10, 'asset_class': 'Equity', 'region': 'US', 'currency': 'USD'},
+                                                                    'GOLD': {'qty': 4, 'asset_class': 'Commodities', 'region': 'Global', 'currency': 'USD'}},
+                                                {'USD': 100}, {'AAPL': 0.5, 'GOLD': 0.5})}
+            self.assertAlmostEqual(state.analytics('P1')['value'], 10 * 104 + 4 * 49 + 100)
+            state.append_market_data(bar)
+            analytics = state.analytics('P1')
+            self.assertAlmostEqual(analytics['value'], 10 * 110 + 4 * 48 + 100)
+            self.assertEqual(len(analytics['returns']), 5)
+
+    def test_workers_load_history_from_store_and_refresh_per_request(self):
+        index = pd.bdate_range('2024-01-01', periods=5)
+        frame = pd.DataFrame({'AAPL': [100, 101, 99, 102, 104.0], 'GOLD': [50, 50.5, 51, 50, 49.0]}, index=index)
+        bar = pd.DataFrame({'AAPL': [110.0], 'GOLD': [48.0]}, index=[index[-1] + pd.offsets.BDay()])
+        with tempfile.TemporaryDirectory() as directory:
+            writer = SharedState(market_data=frame, price_store_dir=directory)
+            with patch('core.state.default_prices', side_effect=AssertionError), patch('core.state.install') as install:
+                worker = SharedState(price_store_dir=directory)
+            install.assert_called_once()
+            pd.testing.assert_frame_equal(worker.market_data, frame, check_freq=False, check_index_type=False)
+            version = worker.data_version
+            with worker.scope():
+                self.assertEqual(worker.data_version, version)
+            writer.append_market_data(bar)
+            with worker.scope():
+                self.assertEqual(worker.market_data.index[-1], bar.index[0])
+            self.assertEqual(worker.data_version, version + 1)
+
+class TestIntentRouter(unittest.TestCase):
+    def setUp(self):
+        self.router = IntentRouter()
+
+    def test_compare_with_entities_routes_to_graphic(self):
+        parsed = self.router.parse("Compare Portfolio ABC with the S&P 500 and Tesla")
+        self.assertEqual(parsed.intent, 'graphic_compare')
+        self.assertEqual(self.router.params(parsed)['items'], [('portfolio', 'P1'), ('index', 'SP500'), ('stock', 'TSLA')])
+        self.assertEqual(self.router.parse("compare").intent, 'compare')
+
+    def test_keywords_and_aliases_match_whole_words(self):
+        self.assertEqual(self.router.parse("compare portfolios").intent, 'compare')
+        self.assertEqual(self.router.parse("compare portfolios on a chart").intent, 'graphic_compare')
+        self.assertEqual(self.router.parse("graphic compare portfolio p1 to sp500").intent, 'graphic_compare')
+        self.assertEqual(self.router.parse("plot p10").entities, ())
+        parsed = self.router.parse("download my holdings")
+        self.assertEqual((parsed.intent, parsed.entities), ('holdings', ()))
+        self.assertEqual(self.router.parse("run scenarios").intent, 'scenario')
+
+    def test_scenario_shock_and_macro_ordering(self):
+        parsed = self.router.parse("run a 15% drop scenario")
+        self.assertEqual(self.router.params(parsed), {'drop': -0.15})
+        self.assertEqual(self.router.parse("show macro scenarios").intent, 'macro_scenarios')
+        self.assertIsNone(self.router.parse("what should I do?").intent)
+
+    def test_rolling_windows(self):
+        parsed = self.router.parse("rolling volatility 30 day and 90-day")
+        self.assertEqual(self.router.params(parsed), {'metric': 'volatility', 'windows': [30, 90]})
+        self.assertEqual(self.router.parse("volatility").intent, 'concentration')
+
+    def test_runtime_extension(self):
+        self.router.add_intent(Intent('esg', ('esg',), 5, 'analysis', 'get_performance'))
+        self.router.add_entity('Microsoft', 'stock', 'MSFT')
+        parsed = self.router.parse("esg view of microsoft")
+        self.assertEqual((parsed.intent, parsed.entities), ('esg', (('stock', 'MSFT'),)))
+
+class TestScenarioEngine(unittest.TestCase):
+    def setUp(self):
+        index = pd.bdate_range('2024-01-01', periods=60)
+        rng = np.random.default_rng(3)
+        self.prices = pd.DataFrame(100 * np.exp(np.cumsum(rng.normal(0, 0.01, (60, 2)), axis=0)), index=index, columns=['AAPL', 'GOLD'])
+        holding = lambda asset, qty: {asset: {'qty': qty, 'asset_class': 'Equity', 'region': 'US', 'currency': 'USD'}}
+        self.portfolios = {'P1': Portfolio("Equity", "Growth", holding('AAPL', 10), {'USD': 0.0}, {'AAPL': 1.0}),
+                           'P2': Portfolio("Mixed", "Diversified", {**holding('AAPL', 5), **holding('GOLD', 10)}, {'USD': 500.0}, {'AAPL': 0.5, 'GOLD': 0.5})}
+        self.engine = ScenarioEngine(self.prices, self.prices.pct_change())
+
+    def test_var_and_cvar_match_a_normal_distribution(self):
+        self.engine.mu, self.engine.factor = np.array([0.001, 0.0]), np.diag([0.02, 0.01])
+        result = self.engine.run([self.portfolios['P1']], [{'impact': 0.0}], n_paths=200000, seed=0)
+        z = 1.6448536269514722
+        self.assertAlmostEqual(result['mean_impact'][0, 0], 0.001, delta=2e-4)
+        self.assertAlmostEqual(result['var_95'][0, 0], 0.001 - 0.02 * z, delta=5e-4)
+        self.assertAlmostEqual(result['cvar_95'][0, 0], 0.001 - 0.02 * np.exp(-z * z / 2) / np.sqrt(2 * np.pi) / 0.05, delta=5e-4)
+
+    def test_seeded_runs_repeat_and_chunking_matches_one_draw(self):
+        W = self.engine.weights(self.portfolios.values())
+        first = self.engine.simulate(W, 1000, seed=7)
+        np.testing.assert_array_equal(first, self.engine.simulate(W, 1000, seed=7))
+        self.assertFalse(np.array_equal(first, self.engine.simulate(W, 1000, seed=8)))
+        np.testing.assert_allclose(self.engine.simulate(W, 1000, seed=7, chunk_size=333), first, rtol=1e-12)
+
+    def test_shocks_shift_by_portfolio_beta(self):
+        state = SharedState(market_data=self.prices, price_store_dir=None)
+        state.portfolios = self.portfolios
+        impacts = asyncio.run(RiskAgent(state).analyze_scenario({'drop': -0.1, 'seed': 5, 'paths': 2000}))
+        self.assertEqual(impacts, asyncio.run(RiskAgent(state).analyze_scenario({'drop': -0.1, 'seed': 5, 'paths': 2000})))
+        engine = RiskAgent(state).scenario_engine()
+        betas = engine.weights(self.portfolios.values()) @ engine.asset_betas
+        for beta, impact in zip(betas, impacts.values()):
+            landing = impact['scenarios']['Soft Landing']
+            self.assertAlmostEqual(impact['var_95'] - landing['var_95'], beta * (-0.1 - 0.05))
+            self.assertAlmostEqual(impact['cvar_95'] - landing['cvar_95'], beta * (-0.1 - 0.05))
+
+class TestOptimizer(unittest.TestCase):
+    def test_solutions_respect_box_and_class_caps(self):
+        rng = np.random.default_rng(0)
+        returns = rng.normal(0.0005, 0.01, size=(500, 5)) * np.array([1, 0.5, 1, 4, 5])
+        mu, cov = returns.mean(axis=0) * 252 + np.array([0, 0, 0, 0.3, 0.3]), np.cov(returns, rowvar=False) * 252
+        assets = ['AAPL', 'BOND_US', 'GOLD', 'BTC', 'ETH']
+        C, caps = class_constraints(assets, {'BTC': 'Cryptocurrency', 'ETH': 'Cryptocurrency'})
+        for method in METHODS:
+            W = solve(mu, cov, method, [2.0, 5.0], upper=0.5, C=C, caps=caps)
+            np.testing.assert_allclose(W.sum(axis=1), 1, atol=1e-6)
+            self.assertTrue((W >= -1e-9).all() and (W <= 0.5 + 1e-9).all())
+            self.assertTrue(((W @ C.T) <= caps + 1e-6).all())
+
+    def test_parallel_solves_reuse_one_pool_and_skip_indices(self):
+        rng = np.random.default_rng(1)
+        returns = rng.normal(0.0005, 0.01, size=(200, 3))
+        mu, cov = returns.mean(axis=0) * 252, np.cov(returns, rowvar=False) * 252
+        self.addCleanup(optimizer.stop_pool)
+        with patch.object(optimizer, 'PARALLEL_MIN', 1), patch.object(optimizer, 'OPTIMIZER_WORKERS', 2):
+            W = optimizer.optimize_many(mu, cov, 'min_variance', [2.0, 5.0])
+            pool = optimizer.get_pool()
+            optimizer.optimize_many(mu, cov, 'min_variance', [2.0, 5.0])
+            self.assertIs(optimizer.get_pool(), pool)
+        np.testing.assert_allclose(W, solve(mu, cov, 'min_variance', [2.0, 5.0]))
+        mu, _ = SharedState(price_store_dir=None).risk_model()
+        self.assertFalse({'SP500', 'DJIA'} & set(mu.index))
+
+class TestHoldingsStore(unittest.TestCase):
+    def test_dict_view_and_columnar_reductions(self):
+        store = HoldingsStore({
+            'AAPL': {'qty': 100, 'asset_class': 'Equity', 'region': 'US', 'currency': 'USD'},
+            'GOLD': {'qty': 50, 'asset_class': 'Commodities', 'region': 'Global', 'currency': 'USD'},
+            'OIL': {'qty': 60, 'asset_class': 'Commodities', 'region': 'Global', 'currency': 'USD'}
+        })
+        store['AAPL']['qty'] -= 40
+        self.assertEqual(store['AAPL']['qty'], 60)
+        self.assertEqual(store.exposure('asset_class', store.qty * np.array([1.0, 2.0, 0.5])), {'Equity': 60, 'Commodities': 130})
+        del store['AAPL']
+        self.assertEqual(list(store), ['OIL', 'GOLD'])
+        self.assertEqual(store.to_dict()['OIL']['region'], 'Global')
+
+class TestRebalanceEngine(unittest.TestCase):
+    def test_orders_respect_threshold_lots_and_cash(self):
+        market = pd.DataFrame({'AAPL': [100.0], 'GOLD': [10.0], 'OIL': [50.0]})
+        valuation = SimpleNamespace(assets=['AAPL', 'GOLD'], qty=np.array([80.0, 200.0]), fx=np.ones(2), cash_value=0.0)
+        portfolio = SimpleNamespace(engine=lambda: valuation, target_allocation={'AAPL': 0.5, 'GOLD': 0.2, 'OIL': 0.3})
+        orders = {o['asset']: o for o in RebalanceEngine(market).orders(portfolio, lot_size=5)}
+        self.assertEqual(orders['AAPL']['action'], 'sell')
+        self.assertEqual(orders['AAPL']['qty'], 30)
+        self.assertEqual(orders['OIL']['action'], 'buy')
+        self.assertLessEqual(sum(o['notional'] for o in orders.values() if o['action'] == 'buy'),
+                             sum(o['notional'] for o in orders.values() if o['action'] == 'sell'))
+
+    def test_untargeted_holdings_kept_unless_liquidating(self):
+        market = pd.DataFrame({'AAPL': [100.0], 'GOLD': [10.0]})
+        valuation = SimpleNamespace(assets=['AAPL', 'GOLD'], qty=np.array([50.0, 500.0]), fx=np.ones(2), cash_value=0.0)
+        portfolio = SimpleNamespace(engine=lambda: valuation, target_allocation={'AAPL': 1.0})
+        engine = RebalanceEngine(market)
+        self.assertEqual(engine.orders(portfolio), [])
+        self.assertEqual({o['asset']: o['action'] for o in engine.orders(portfolio, liquidate=True)}, {'AAPL': 'buy', 'GOLD': 'sell'})
+
+    def test_orders_settle_in_instrument_currency(self):
+        index = pd.bdate_range('2024-01-01', periods=2)
+        state = SharedState(market_data=pd.DataFrame({'REAL_ESTATE': [100.0, 100.0], 'WINE_VINTAGE': [50.0, 50.0]}, index=index), price_store_dir=None)
+        state.portfolios = {'P1': Portfolio("Euro", "Growth", {'REAL_ESTATE': {'qty': 10, 'asset_class': 'Real Estate', 'region': 'Europe', 'currency': 'EUR'}},
+                                            {'USD': 500.0, 'EUR': 1000.0})}
+        state.instruments = {'WINE_VINTAGE': {'asset_class': 'Passion Assets', 'region': 'Europe', 'currency': 'EUR'}}
+        rate = state.fx.rate('EUR')
+        TradeAgent(state)._apply_orders('P1', [{'asset': 'REAL_ESTATE', 'action': 'buy', 'qty': 2.0, 'notional': 200 * rate, 'drift': 0.1},
+                                               {'asset': 'WINE_VINTAGE', 'action': 'buy', 'qty': 2.0, 'notional': 100 * rate, 'drift': 0.1}])
+        p = state.portfolios['P1']
+        self.assertEqual(dict(p.holdings['WINE_VINTAGE']), {'qty': 2.0, 'asset_class': 'Passion Assets', 'region': 'Europe', 'currency': 'EUR'})
+        self.assertAlmostEqual(p.cash['EUR'], 700.0)
+        self.assertEqual(p.cash['USD'], 500.0)
+
+class TestReplayBuffer(unittest.TestCase):
+    def test_ring_overwrite_sampling_and_persistence(self):
+        buffer = ReplayBuffer(4, 3, seed=0)
+        buffer.extend(np.arange(18).reshape(6, 3), [0, 1, 0, 1, 0, 1], np.arange(6), np.zeros((6, 3)))
+        self.assertEqual(len(buffer), 4)
+        self.assertEqual(sorted(buffer.rewards.tolist()), [2, 3, 4, 5])
+        idx, states, actions, rewards, _ = buffer.sample(8)
+        np.testing.assert_array_equal(states[:, 0] / 3, rewards)
+        buffer.alpha = 1.0
+        buffer.update_priorities(np.arange(4), [0, 0, 0, 10])
+        self.assertTrue(np.all(buffer.sample(8)[0] == 3))
+        first, second = buffer.sample(8), buffer.sample(8)
+        self.assertFalse(any(np.shares_memory(a, b) for a, b in zip(first[1:], second[1:])))
+        out = buffer.scratch(8)
+        self.assertIs(buffer.sample(8, out=out)[1], out['states'])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f"{tmp}/replay.npz"
+            buffer.save(path)
+            restored = ReplayBuffer(4, 3)
+            self.assertTrue(restored.load(path))
+            self.assertEqual(restored.rewards.tolist(), [2, 3, 4, 5])
+
+class TestTrainingScheduler(unittest.TestCase):
+    def test_single_checkpoint_worker_writes_latest_weights(self):
+        from utils.networks import TransformerPredictor, QNetwork
+        from utils.training import TrainingScheduler
+        with tempfile.TemporaryDirectory() as tmp:
+            scheduler = TrainingScheduler(TransformerPredictor(), QNetwork(15, 4), checkpoint_dir=tmp, keep=2)
+            digest = scheduler.digest
+            for _ in range(3):
+                scheduler.step()
+            scheduler.stop()
+            self.assertNotEqual(scheduler.digest, digest)
+            written = sorted(f for f in os.listdir(tmp) if f.startswith('predictor'))
+            self.assertLessEqual(len(written), 2)
+            self.assertEqual(written[-1], 'predictor-v000003.pth')
+            self.assertFalse(scheduler._checkpointer.is_alive())
+            self.assertEqual([t for t in threading.enumerate() if t.name == 'model-checkpointer'], [])
+
+    def test_batched_inference_matches_per_asset_inference(self):
+        import torch
+        from utils.networks import TransformerPredictor, QNetwork
+        from core.inference import WINDOW, batched_q_values
+        torch.manual_seed(0)
+        predictor, q_network = TransformerPredictor().eval(), QNetwork(15, 4).eval()
+        windows = np.random.default_rng(4).normal(0, 0.01, (6, WINDOW)).astype(np.float32)
+        with torch.inference_mode():
+            preds = predictor.predict_batch(torch.from_numpy(windows)).numpy()
+            single = np.array([predictor(torch.from_numpy(w).unsqueeze(0)).item() for w in windows])
+            rows = [np.concatenate([w, [p, 1.2], np.zeros(15 - WINDOW - 2)]).astype(np.float32) for w, p in zip(windows, preds)]
+            single_q = np.stack([q_network(torch.from_numpy(row).unsqueeze(0))[0].numpy() for row in rows])
+        np.testing.assert_allclose(preds, single, atol=1e-6)
+        with patch('core.inference.get_scheduler', return_value=SimpleNamespace(model={'q_network': q_network}.get)):
+            np.testing.assert_allclose(batched_q_values(windows, preds, 1.2), single_q, atol=1e-6)
+
+class TestRollup(unittest.TestCase):
+    def test_shared_portfolio_counted_once_and_branches_recomputed(self):
+        state = SharedState()
+        p1 = Portfolio("EquityFocused", "Growth", {'AAPL': {'qty': 100, 'asset_class': 'Equity', 'region': 'US', 'currency': 'USD'}}, {'USD': 1000})
+        p2 = Portfolio("Diversified", "Diversified", {'GOLD': {'qty': 50, 'asset_class': 'Commodities', 'region': 'Global', 'currency': 'USD'}}, {'USD': 500})
+        state.portfolios = {'P1': p1, 'P2': p2}
+        state.hierarchy['holistic']['groups']['Family'] = {'individuals': {'A': {'portfolios': [p1]}, 'B': {'portfolios': [p2]}}}
+        state.hierarchy['holistic']['groups']['Advisor'] = {'individuals': {'C': {'portfolios': [p1, p2]}}}
+        holistic = state.rollups.rollup()
+        self.assertAlmostEqual(holistic['value'], state.analytics('P1')['value'] + state.analytics('P2')['value'])
+        self.assertEqual(set(holistic['children']), {'Family', 'Advisor'})
+        state.rollups.rollup(('holistic', 'Family'))
+        recomputed = state.rollups.recomputed
+        with state.edit('P2') as draft:
+            draft.holdings.adjust('GOLD', 5)
+        state.rollups.rollup(('holistic', 'Family'))
+        self.assertEqual(state.rollups.recomputed - recomputed, 2)
+
+    def test_scoped_tree_hides_other_clients(self):
+        state = SharedState()
+        p1 = Portfolio("EquityFocused", "Growth", {'AAPL': {'qty': 100, 'asset_class': 'Equity', 'region': 'US', 'currency': 'USD'}}, {'USD': 1000})
+        p2 = Portfolio("Diversified", "Diversified", {'GOLD': {'qty': 50, 'asset_class': 'Commodities', 'region': 'Global', 'currency': 'USD'}}, {'USD': 500})
+        state.book.load({'P1': p1}, 'Client_A')
+        state.book.load({'P2': p2}, 'Client_B')
+        groups = state.hierarchy['holistic']['groups']
+        groups['Client_A'] = {'individuals': {'A': {'portfolios': [p1]}}}
+        groups['Client_B'] = {'individuals': {'B': {'portfolios': [p2]}}}
+        groups['Advisor'] = {'individuals': {'C': {'portfolios': [p1, p2]}, 'D': {'portfolios': [p2]}}}
+        self.assertEqual(len(state.rollups.tree()), 8)
+        with state.scope('Client_A'):
+            tree = state.rollups.tree()
+            self.assertEqual(set(tree), {('holistic',), ('holistic', 'Client_A'), ('holistic', 'Client_A', 'A'),
+                                         ('holistic', 'Advisor'), ('holistic', 'Advisor', 'C')})
+            self.assertEqual(tree[('holistic', 'Advisor', 'C')], ['P1'])
+            self.assertEqual(state.rollups.rollup()['value'], state.analytics('P1')['value'])
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram_prometheus_text(self):
+        registry = MetricsRegistry()
+        h = Histogram('agent_seconds', 'Agent latency', ('agent',), buckets=(0.1, 1.0), registry=registry)
+        h.observe(0.05, agent='risk')
+        h.observe(0.5, agent='risk')
+        text = registry.render()
+        self.assertIn('agent_seconds_bucket{agent="risk",le="0.1"} 1', text)
+        self.assertIn('agent_seconds_bucket{agent="risk",le="+Inf"} 2', text)
+        self.assertIn('agent_seconds_count{agent="risk"} 2', text)
+        CounterFunc('lookups_total', 'Lookups', lambda: {('hit',): 3}, ('result',), registry=registry)
+        self.assertIn('# TYPE lookups_total counter\nlookups_total{result="hit"} 3', registry.render())
+
+    def test_nested_spans_share_trace(self):
+        async def run():
+            with span('query') as root:
+                async def child():
+                    with span('risk_scenario.analyze_scenario'):
+                        await asyncio.sleep(0)
+                await asyncio.gather(child(), child())
+            return root
+        root = asyncio.run(run())
+        self.assertIs(traces[-1], root)
+        self.assertEqual([c.parent_id for c in root.children], [root.span_id, root.span_id])
+        self.assertEqual({c.trace_id for c in root.children}, {root.trace_id})
+
+class TestFXEngine(unittest.TestCase):
+    def test_series_triangulation_and_base_conversion(self):
+        index = pd.date_range('2024-01-01', periods=4)
+        engine = FXEngine.from_static({'GBP': 1.25})
+        engine.set_rates('EUR', pd.Series([1.0, 1.1], index=index[[0, 2]]))
+        engine.set_rates('CHF', 0.9, quote='EUR')
+        usd = engine.matrix(['USD', 'EUR', 'CHF', 'GBP'], index)
+        np.testing.assert_allclose(usd[:, 1], [1.0, 1.0, 1.1, 1.1])
+        np.testing.assert_allclose(usd[:, 2], [0.9, 0.9, 0.99, 0.99])
+        self.assertIs(engine.matrix(['USD', 'EUR', 'CHF', 'GBP'], index), usd)
+        self.assertAlmostEqual(engine.rate('EUR', index[-1], base='GBP'), 1.1 / 1.25)
+        with self.assertRaises(KeyError):
+            engine.rate('BTC')
+        gapped = index[[0, 1, 3]].append(pd.DatetimeIndex([index[3] + pd.Timedelta(days=1)]))
+        same_ends = index[[0]].append(index[2:]).append(gapped[-1:])
+        self.assertFalse(np.array_equal(engine.matrix(['EUR'], gapped), engine.matrix(['EUR'], same_ends)))
+
+    def test_exposures_and_positions_in_base_currency(self):
+        index = pd.bdate_range('2024-01-01', periods=3)
+        frame = pd.DataFrame({'AAPL': [100.0] * 3, 'REAL_ESTATE': [100.0] * 3, 'SP500': [10.0, 11.0, 12.0]}, index=index)
+        state = SharedState(market_data=frame, price_store_dir=None)
+        state.portfolios = {'P1': Portfolio("Mixed", "Growth", {'AAPL': {'qty': 10, 'asset_class': 'Equity', 'region': 'US', 'currency': 'USD'},
+                                                                'REAL_ESTATE': {'qty': 10, 'asset_class': 'Real Estate', 'region': 'Europe', 'currency': 'EUR'}},
+                                            {'USD': 0})}
+        state.hierarchy['holistic']['groups']['G'] = {'individuals': {'I': {'portfolios': [state.portfolios['P1']]}}}
+        rate = state.fx.rate('EUR')
+        analytics = state.analytics('P1')
+        self.assertAlmostEqual(analytics['value'], 1000 * (1 + rate))
+        self.assertAlmostEqual(analytics['currency_exposure']['EUR'] / analytics['currency_exposure']['USD'], rate)
+        self.assertAlmostEqual(analytics['hhi'], (1 + rate ** 2) / (1 + rate) ** 2)
+        self.assertAlmostEqual(state.rollups.rollup()['hhi'], analytics['hhi'])
+
+class TestPortfolioRegistry(unittest.TestCase):
+    def test_scoped_snapshots_and_atomic_commit(self):
+        registry = PortfolioRegistry()
+        p1 = Portfolio("EquityFocused", "Growth", {'AAPL': {'qty': 100, 'asset_class': 'Equity', 'region': 'US', 'currency': 'USD'}}, {'USD': 1000}, {'AAPL': 1.0})
+        registry.load({'P1': p1}, 'Family_Smith')
+        registry.load({'P1': p1}, 'Client_ABC')
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as f:
+            f.write('{"client": "Client_XYZ", "name": "P9", "holdings": {"GOLD": {"qty": 5}}, "cash": {"USD": 10}}\n')
+        self.assertEqual(registry.load_file(f.name), 1)
+        self.assertEqual(list(registry.view('Client_XYZ')), ['P9'])
+        snapshot = registry.view('Family_Smith')
+        with registry.edit('P1') as draft:
+            draft.holdings.adjust('AAPL', -40)
+        self.assertEqual(snapshot['P1'].holdings['AAPL']['qty'], 100)
+        self.assertEqual(registry.view('Client_ABC')['P1'].holdings['AAPL']['qty'], 60)
+        with self.assertRaises(RuntimeError):
+            with registry.edit('P1') as draft:
+                draft.holdings.adjust('AAPL', -60)
+                raise RuntimeError
+        self.assertEqual(registry.view()['P1'].holdings['AAPL']['qty'], 60)
+        self.assertGreater(registry.view()['P1'].version, p1.version)
+
+    def test_edit_many_publishes_once(self):
+        registry = PortfolioRegistry()
+        book = {f"P{i}": Portfolio(f"P{i}", "Growth", {'AAPL': {'qty': 1, 'asset_class': 'Equity', 'region': 'US', 'currency': 'USD'}},
+                                   {'USD': 10}, {'AAPL': 1.0}) for i in range(3)}
+        registry.load(book, 'Client_ABC')
+        version = registry.version
+        with registry.edit_many(['P0', 'P2']) as drafts:
+            for draft in drafts.values():
+                draft.target_allocation = {'AAPL': 0.5}
+        self.assertEqual(registry.version, version + 1)
+        self.assertEqual({name: p.target_allocation['AAPL'] for name, p in registry.view('Client_ABC').items()}, {'P0': 0.5, 'P1': 1.0, 'P2': 0.5})
+        self.assertIs(registry.view('Client_ABC')['P1'], book['P1'])
+
+    def test_tenants_with_the_same_portfolio_name_stay_isolated(self):
+        state = SharedState()
+        holdings = lambda qty: {'AAPL': {'qty': qty, 'asset_class': 'Equity', 'region': 'US', 'currency': 'USD'}}
+        state.book.load({'P1': Portfolio("A", "Growth", holdings(100), {'USD': 0}, {'AAPL': 1.0})}, 'Client_A')
+        state.book.load({'P1': Portfolio("B", "Growth", holdings(10), {'USD': 0}, {'AAPL': 1.0})}, 'Client_B')
+        with state.scope('Client_A'):
+            value_a = state.analytics('P1')['value']
+        with state.scope('Client_B'):
+            self.assertAlmostEqual(state.analytics('P1')['value'] * 10, value_a)
+            with state.edit('P1') as draft:
+                draft.holdings.adjust('AAPL', 10)
+            self.assertAlmostEqual(state.analytics('P1')['value'] * 5, value_a)
+        self.assertEqual(state.book.view('Client_A')['P1'].holdings['AAPL']['qty'], 100)
+        with self.assertRaises(ValueError):
+            with state.edit('P1'):
+                pass
+        self.assertEqual(state.book.ambiguous(), {'P1'})
+        for shards in (None, ['Client_A', 'Client_B']):
+            with self.assertRaises(ValueError):
+                state.book.view(shards)
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as f:
+            f.write('{"client": "Client_C", "name": "P0", "holdings": {}}\n')
+        state.book.load_file(f.name)
+        self.assertEqual(state.book.view('Client_C')['P0'].target_allocation, {})
+
+class TestRollingStats(unittest.TestCase):
+    def test_incremental_matches_full_recompute(self):
+        rng = np.random.default_rng(1)
+        returns = pd.DataFrame(rng.normal(0, 0.01, (120, 3)), columns=['A', 'B', 'C'])
+        market = returns.mean(axis=1)
+        stats = RollingStats(returns.columns, windows=(20, 50), pairwise=True).seed(returns.iloc[:60], market.iloc[:60])
+        for i in range(60, 120):
+            stats.update(returns.iloc[i], market.iloc[i])
+        tail = returns.iloc[-20:]
+        np.testing.assert_allclose(stats.volatility(20), tail.std() * np.sqrt(252))
+        np.testing.assert_allclose(stats.beta(50), returns.iloc[-50:].apply(lambda r: r.cov(market.iloc[-50:])) / market.iloc[-50:].var())
+        np.testing.assert_allclose(stats.correlation(20), tail.corr().to_numpy())
+        levels = (1 + returns.iloc[-50:]).cumprod()
+        np.testing.assert_allclose(stats.drawdown(20), levels.iloc[-1] / levels.iloc[-20:].max() - 1)
+
+    def test_adhoc_windows_leave_engine_untouched(self):
+        state = SharedState()
+        state.portfolios = {'P1': Portfolio("EquityFocused", "Growth", {'AAPL': {'qty': 100, 'asset_class': 'Equity', 'region': 'US', 'currency': 'USD'}},
+                                            {'USD': 1000}, {'AAPL': 1.0})}
+        engine = state.rolling
+        for bad in ([0], [10 ** 7]):
+            with self.assertRaises(ValueError):
+                engine.report('volatility', bad)
+        adhoc = engine.report('volatility', [45])['45d']['P1']['volatility']
+        self.assertEqual(engine.windows, (30, 90, 252))
+        engine.add_windows([45])
+        self.assertAlmostEqual(engine.report('volatility', [45])['45d']['P1']['volatility'], adhoc)
+
+    def test_portfolio_series_follow_scope_and_dated_fx(self):
+        index = pd.bdate_range('2024-01-01', periods=40)
+        rng = np.random.default_rng(2)
+        data = pd.DataFrame(100 * np.exp(np.cumsum(rng.normal(0, 0.01, (40, 2)), axis=0)), index=index, columns=['AAPL', 'REAL_ESTATE'])
+        engine = FXEngine()
+        engine.set_rates('EUR', pd.Series(np.linspace(1.0, 1.2, 40), index=index))
+        holding = lambda asset, currency: {asset: {'qty': 10, 'asset_class': 'Equity', 'region': 'US', 'currency': currency}}
+        vols = {}
+        with patch('core.valuation.fx', engine):
+            state = SharedState(market_data=data, price_store_dir=None)
+            state.fx = engine
+            state.book.load({'P1': Portfolio("A", "Growth", holding('AAPL', 'USD'), {'USD': 0.0}, {'AAPL': 1.0})}, 'Client_A')
+            state.book.load({'P1': Portfolio("B", "Growth", holding('REAL_ESTATE', 'EUR'), {'EUR': 100.0}, {'REAL_ESTATE': 1.0})}, 'Client_B')
+            for client in ('Client_A', 'Client_B'):
+                with state.scope(client):
+                    vols[client] = state.rolling.report('volatility', [30])['30d']['P1']['volatility']
+                    self.assertAlmostEqual(vols[client], state.portfolios['P1'].returns(data).iloc[-30:].std() * np.sqrt(252))
+        self.assertNotAlmostEqual(vols['Client_A'], vols['Client_B'])
+
+class TestResultStore(unittest.TestCase):
+    def test_roundtrip_ttl_eviction_and_warm(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f"{tmp}/results.db"
+            store = ResultStore(path, ttl=60, max_bytes=10 ** 6, hot_size=4)
+            frame = pd.DataFrame(np.arange(6.0).reshape(3, 2), columns=['A', 'B'])
+            key = store.key('forecasting', 'forecast_returns', '{}', 'fp1')
+            self.assertNotEqual(key, store.key('forecasting', 'forecast_returns', '{}', 'fp2'))
+            self.assertNotEqual(key, ResultStore(path, namespace='next-release').key('forecasting', 'forecast_returns', '{}', 'fp1'))
+            self.assertIs(store.get(key), MISSING)
+            store.put(key, {'frame': frame, 'weights': np.ones(3)})
+            store.put('array', np.arange(5000.0))
+            store.put('expired', 1, ttl=-1)
+            other = ResultStore(path, hot_size=4)
+            self.assertEqual(other.warm(), 2)
+            pd.testing.assert_frame_equal(other.get(key)['frame'], frame)
+            np.testing.assert_array_equal(ResultStore(path).get('array'), np.arange(5000.0))
+            self.assertIs(other.get('expired'), MISSING)
+            small = ResultStore(path, max_bytes=1000)
+            small.put('latest', 'x' * 100)
+            self.assertIs(ResultStore(path).get(key), MISSING)
+            self.assertEqual(ResultStore(path).get('latest'), 'x' * 100)
+            self.assertLessEqual(small.stats()['bytes'], 1000)
+            os.chmod(path, 0o666)
+            with self.assertRaises(PermissionError):
+                ResultStore(path)
+
+    def test_registry_reads_through_for_deterministic_methods_only(self):
+        calls = []
+        class Risk:
+            def __init__(self, state):
+                self.state = state
+            async def get_concentration_risk(self, params=None):
+                calls.append('concentration')
+                return {'P1': len(calls)}
+            async def analyze_scenario(self, params):
+                calls.append('scenario')
+                return len(calls)
+        def registry(path):
+            state = SharedState()
+            state.portfolios = {'P1': Portfolio("EquityFocused", "Growth", {'AAPL': {'qty': 100, 'asset_class': 'Equity', 'region': 'US', 'currency': 'USD'}},
+                                                {'USD': 1000}, {'AAPL': 1.0})}
+            return AgentRegistry(state, {'risk_scenario': Risk}, store=ResultStore(path))
+        with tempfile.TemporaryDirectory() as tmp:
+            first, second = registry(f"{tmp}/results.db"), registry(f"{tmp}/results.db")
+            for reg in (first, second):
+                asyncio.run(reg.delegate('risk_scenario', 'get_concentration_risk'))
+                asyncio.run(reg.delegate('risk_scenario', 'analyze_scenario', {'drop': -0.1}))
+                asyncio.run(reg.delegate('risk_scenario', 'analyze_scenario', {'drop': -0.1, 'seed': 1}))
+            self.assertEqual(calls, ['concentration', 'scenario', 'scenario', 'scenario'])
+            with second.state.edit('P1') as draft:
+                draft.holdings.adjust('AAPL', 1)
+            asyncio.run(second.delegate('risk_scenario', 'get_concentration_risk'))
+            self.assertEqual(calls[-1], 'concentration')
+
+class TestAgentRegistry(unittest.TestCase):
+    def test_waiter_recomputes_when_memo_owner_is_cancelled(self):
+        calls = []
+        class Research:
+            def __init__(self, state):
+                self.release = asyncio.Event()
+            async def get_market_data(self, params=None):
+                calls.append(len(calls))
+                await self.release.wait()
+                return len(calls)
+        registry = AgentRegistry(SimpleNamespace(), {'research': Research}, store=None)
+        async def run():
+            with registry.request_scope():
+                owner = asyncio.create_task(registry.delegate('research', 'get_market_data'))
+                await asyncio.sleep(0)
+                waiter = asyncio.create_task(registry.delegate('research', 'get_market_data'))
+                await asyncio.sleep(0)
+                owner.cancel()
+                await asyncio.sleep(0)
+                registry.get('research').release.set()
+                result = await asyncio.wait_for(waiter, 1)
+                return owner.cancelled(), result
+        self.assertEqual(asyncio.run(run()), (True, 2))
+        self.assertEqual(len(calls), 2)
 
 if __name__ == '__main__':
     unittest.main()
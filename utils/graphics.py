@@ -1,21 +1,66 @@
-import matplotlib.pyplot as plt
 import io
+import os
+import asyncio
 import base64
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import logging
 
 logger = logging.getLogger(__name__)
 
-async def generate_performance_graph(series_dict):
-    fig, ax = plt.subplots(figsize=(12, 8))
-    for label, series in series_dict.items():
-        ax.plot(series, label=label)
-    ax.legend()
-    ax.set_title("Performance Comparison")
-    ax.set_xlabel("Date")
-    ax.set_ylabel("Value")
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    img_base64 = base64.b64encode(buf.read()).decode('utf-8')
-    plt.close()
-    return f"data:image/png;base64,{img_base64}"
+MAX_POINTS = int(os.getenv('CHART_MAX_POINTS', 1000))
+FORMATS = ('png', 'svg', 'json')
+
+def load_backend():
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib.figure import Figure
+    return Figure
+
+def downsample(series, max_points=MAX_POINTS):
+    if len(series) <= max_points:
+        return series
+    values = series.to_numpy()
+    edges = np.linspace(0, len(values), max_points // 2 + 1).astype(int)
+    keep = []
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        bucket = values[lo:hi]
+        if np.isnan(bucket).all():
+            continue
+        keep.extend(sorted({lo + int(np.nanargmin(bucket)), lo + int(np.nanargmax(bucket))}))
+    return series.iloc[keep]
+
+class ChartRenderer:
+    def __init__(self, max_workers=int(os.getenv('CHART_WORKERS', 2))):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='chart')
+
+    def _draw(self, series_dict, fmt, title, xlabel, ylabel):
+        Figure = load_backend()
+        fig = Figure(figsize=(12, 8))
+        ax = fig.subplots()
+        for label, series in series_dict.items():
+            ax.plot(series.index, series.to_numpy(), label=label)
+        ax.legend()
+        ax.set_title(title)
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(ylabel)
+        buf = io.BytesIO()
+        fig.savefig(buf, format=fmt)
+        return buf.getvalue()
+
+    async def render(self, series_dict, fmt='png', title="Performance Comparison", xlabel="Date", ylabel="Value"):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported chart format: {fmt}")
+        series_dict = {label: downsample(series) for label, series in series_dict.items()}
+        if fmt == 'json':
+            return {label: {'index': [str(i) for i in series.index], 'values': series.tolist()} for label, series in series_dict.items()}
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(self.executor, self._draw, series_dict, fmt, title, xlabel, ylabel)
+        if fmt == 'svg':
+            return data.decode('utf-8')
+        return f"data:image/png;base64,{base64.b64encode(data).decode('utf-8')}"
+
+renderer = ChartRenderer()
+
+async def generate_performance_graph(series_dict, fmt='png'):
+    return await renderer.render(series_dict, fmt)
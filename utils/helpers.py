@@ -1,4 +1,5 @@
 import random
+import zlib
 import logging
 
 logger = logging.getLogger(__name__)
@@ -8,3 +9,14 @@ def calculate_esg_score(portfolio):
 
 def simulate_tax_optimization(proceeds):
     return proceeds * random.uniform(0.8, 0.95)
+
+async def encode_stream(chunks, gzip=False):
+    compressor = zlib.compressobj(wbits=31) if gzip else None
+    async for chunk in chunks:
+        data = chunk.encode('utf-8')
+        if compressor is not None:
+            data = compressor.compress(data)
+        if data:
+            yield data
+    if compressor is not None:
+        yield compressor.flush()
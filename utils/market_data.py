@@ -0,0 +1,56 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+import logging
+
+logger = logging.getLogger(__name__)
+
+MARKET_DATA_FILE = os.getenv('MARKET_DATA_FILE')
+HISTORY_DAYS = int(os.getenv('MARKET_HISTORY_DAYS', 756))
+
+INDICES = ['SP500', 'DJIA']
+INSTRUMENTS = ['AAPL', 'TSLA', 'BOND_US', 'BOND_CORP', 'GOLD', 'OIL', 'PE_FUND', 'HEDGE_FUND', 'REAL_ESTATE',
+               'BTC', 'ETH', 'ART_COLLECTION', 'WINE_VINTAGE']
+EXCHANGE_RATES = {'USD': 1.0, 'EUR': 1.08, 'GBP': 1.27, 'CHF': 1.12, 'HKD': 0.128}
+
+def synthetic_prices(names, n_dates, seed=0, end=None):
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range(end=end or pd.Timestamp.today().normalize(), periods=n_dates)
+    drift = rng.normal(0.0003, 0.0002, len(names))
+    vol = rng.uniform(0.005, 0.03, len(names))
+    shocks = rng.standard_normal((n_dates, len(names))) * vol + drift
+    return pd.DataFrame(100 * np.exp(np.cumsum(shocks, axis=0)), index=index, columns=list(names))
+
+def load_prices(path):
+    if path.endswith('.parquet'):
+        frame = pd.read_parquet(path)
+    else:
+        frame = pd.read_csv(path, index_col=0, parse_dates=True)
+    frame = frame.sort_index().astype(float)
+    logger.info(f"Loaded {frame.shape[1]} price series over {len(frame)} dates from {os.path.basename(path)}")
+    return frame
+
+exchange_rates = dict(EXCHANGE_RATES)
+_lock = threading.Lock()
+
+def install(frame):
+    global prices, dates, assets
+    prices, dates, assets = frame, frame.index, [c for c in frame.columns if c not in INDICES]
+
+def default_prices():
+    with _lock:
+        if 'prices' not in globals():
+            install(load_prices(MARKET_DATA_FILE) if MARKET_DATA_FILE else synthetic_prices(INDICES + INSTRUMENTS, HISTORY_DAYS))
+    return prices
+
+def default_assets():
+    default_prices()
+    return assets
+
+def __getattr__(name):
+    # prices, dates and assets load on first use, so workers backed by a price store never build the frame
+    if name in ('prices', 'dates', 'assets'):
+        default_prices()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,279 @@
+import asyncio
+import bisect
+import contextvars
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter as Tally, deque
+from contextlib import contextmanager
+import logging
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TRACE_BUFFER = int(os.getenv('TRACE_BUFFER', 256))
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0.0))
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', 0.005))
+LOOP_LAG_INTERVAL = float(os.getenv('LOOP_LAG_INTERVAL', 0.1))
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{n}="{str(v)}"' for n, v in zip(names, values)) + '}'
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help, labelnames=(), registry=None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(n, '') for n in self.labelnames)
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=(), registry=None):
+        super().__init__(name, help, labelnames, registry)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items()) or ([((), 0)] if not self.labelnames else [])
+        return [f"{self.name}{_labels(self.labelnames, key)} {value}" for key, value in items]
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, help, fn, labelnames=(), registry=None):
+        super().__init__(name, help, labelnames, registry)
+        self.fn = fn
+
+    def samples(self):
+        values = self.fn()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [f"{self.name}{_labels(self.labelnames, key)} {value}" for key, value in values.items()]
+
+class CounterFunc(Gauge):
+    kind = 'counter'
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS, registry=None):
+        super().__init__(name, help, labelnames, registry)
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def count(self, **labels):
+        series = self._series.get(self._key(labels))
+        return series[2] if series else 0
+
+    def samples(self):
+        lines = []
+        with self._lock:
+            items = [(key, list(counts), total, n) for key, (counts, total, n) in self._series.items()]
+        names = self.labelnames + ('le',)
+        for key, counts, total, n in items:
+            for bound, cumulative in zip(self.buckets + ('+Inf',), itertools.accumulate(counts)):
+                lines.append(f"{self.name}_bucket{_labels(names, key + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {n}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+
+    def unregister(self, name):
+        self._metrics.pop(name, None)
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            try:
+                lines.extend(metric.render())
+            except Exception:
+                logger.exception(f"Failed to collect metric {metric.name}")
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = MetricsRegistry()
+
+QUERY_SECONDS = Histogram('wealth_query_seconds', 'End-to-end query latency by intent', ('intent',))
+AGENT_SECONDS = Histogram('wealth_agent_call_seconds', 'Agent method latency per delegate call', ('agent', 'method', 'memo'))
+AGENT_ERRORS = Counter('wealth_agent_errors_total', 'Agent method calls that raised', ('agent', 'method'))
+INFERENCE_SECONDS = Histogram('wealth_model_inference_seconds', 'Batched model inference time', ('model',))
+TRAINING_SECONDS = Histogram('wealth_model_training_seconds', 'Background training step time', ('phase',))
+LOOP_LAG_SECONDS = Histogram('wealth_event_loop_lag_seconds', 'Event loop scheduling delay beyond the probe interval',
+                             buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+COALESCED = Counter('wealth_queries_coalesced_total', 'Queries answered by an identical in-flight request')
+
+class Span:
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'attrs', 'start', 'duration', 'children')
+
+    def __init__(self, trace_id, span_id, parent_id, name, attrs):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = attrs
+        self.start = time.time()
+        self.duration = None
+        self.children = []
+
+    def to_dict(self):
+        return {'span_id': self.span_id, 'parent_id': self.parent_id, 'name': self.name, 'attrs': self.attrs,
+                'start': self.start, 'duration_ms': None if self.duration is None else self.duration * 1000,
+                'children': [child.to_dict() for child in self.children]}
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+_ids = itertools.count(1)
+traces = deque(maxlen=TRACE_BUFFER)
+
+def current_span():
+    return _current_span.get()
+
+@contextmanager
+def span(name, **attrs):
+    parent = _current_span.get()
+    span_id = next(_ids)
+    s = Span(parent.trace_id if parent else span_id, span_id, parent.span_id if parent else None, name, attrs)
+    if parent is not None:
+        parent.children.append(s)
+    token = _current_span.set(s)
+    t0 = time.perf_counter()
+    try:
+        yield s
+    except BaseException as e:
+        s.attrs['error'] = type(e).__name__
+        raise
+    finally:
+        s.duration = time.perf_counter() - t0
+        _current_span.reset(token)
+        if parent is None:
+            traces.append(s)
+        logger.debug(f"span {s.name} trace={s.trace_id} parent={s.parent_id} {s.duration * 1000:.2f}ms")
+
+def recent_traces(limit=20):
+    return [s.to_dict() for s in list(traces)[-limit:]]
+
+class SamplingProfiler:
+    def __init__(self, interval=PROFILE_INTERVAL, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Tally()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    stack.append(f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def folded(self):
+        return '\n'.join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+@contextmanager
+def profile_request(name, rate=None):
+    rate = PROFILE_SAMPLE_RATE if rate is None else rate
+    if rate <= 0 or random.random() >= rate:
+        yield None
+        return
+    profiler = SamplingProfiler()
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        s = _current_span.get()
+        if s is not None:
+            s.attrs['profile'] = profiler.folded()
+        top = '; '.join(f"{stack.rsplit(';', 1)[-1]} x{count}" for stack, count in profiler.stacks.most_common(3))
+        logger.info(f"Profiled {name!r}: {profiler.samples} samples, hottest frames: {top}")
+
+class LoopLagMonitor:
+    def __init__(self, interval=LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self.max_lag = 0.0
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - expected, 0.0)
+            self.max_lag = max(self.max_lag, lag)
+            LOOP_LAG_SECONDS.observe(lag)
+            if lag > 0.1:
+                logger.warning(f"Event loop blocked for {lag * 1000:.0f}ms")
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+loop_monitor = LoopLagMonitor()
@@ -1,47 +1,38 @@
-import torch
-import torch.nn as nn
-import torch.optim as optim
-import torch.nn.functional as F
 import os
+import threading
 import logging
 
 logger = logging.getLogger(__name__)
 
-class TransformerPredictor(nn.Module):
-    def __init__(self, input_dim=10, d_model=64, nhead=4, num_layers=2):
-        super().__init__()
-        self.embedding = nn.Linear(input_dim, d_model)
-        self.transformer = nn.TransformerEncoder(
-            nn.TransformerEncoderLayer(d_model, nhead), num_layers
-        )
-        self.fc = nn.Linear(d_model, 1)
-
-    def forward(self, x):
-        x = self.embedding(x)
-        x = self.transformer(x.unsqueeze(1)).squeeze(1)
-        return self.fc(x.mean(dim=0, keepdim=True))
-
-predictor = TransformerPredictor()
-optimizer = optim.Adam(predictor.parameters(), lr=0.001)
-
-class QNetwork(nn.Module):
-    def __init__(self, state_dim, action_dim):
-        super().__init__()
-        self.fc1 = nn.Linear(state_dim, 128)
-        self.fc2 = nn.Linear(128, 128)
-        self.fc3 = nn.Linear(128, action_dim)
-
-    def forward(self, state):
-        x = F.relu(self.fc1(state))
-        x = F.relu(self.fc2(x))
-        return self.fc3(x)
-
 state_dim = 15
 action_dim = 4
-q_network = QNetwork(state_dim, action_dim)
-rl_optimizer = optim.Adam(q_network.parameters(), lr=0.001)
+
+_models = {}
+_models_lock = threading.Lock()
+
+def get_models():
+    with _models_lock:
+        if not _models:
+            from utils.networks import TransformerPredictor, QNetwork
+            predictor = TransformerPredictor()
+            q_network = QNetwork(state_dim, action_dim)
+            load_model(predictor)
+            load_model(q_network)
+            _models.update(predictor=predictor, q_network=q_network)
+            logger.info("Models constructed.")
+    return _models
+
+def __getattr__(name):
+    if name in ('predictor', 'q_network'):
+        return get_models()[name]
+    if name in ('TransformerPredictor', 'QNetwork'):
+        from utils import networks
+        return getattr(networks, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def train_predictor(predictor, optimizer):
+    import torch
+    import torch.nn.functional as F
     dummy_input = torch.randn(64, 10)
     dummy_target = torch.randn(64, 1)
     pred_output = predictor(dummy_input)
@@ -52,13 +43,12 @@ def train_predictor(predictor, optimizer):
     logger.info("Predictor trained.")
 
 def save_model(model, path='model.pth'):
+    import torch
     torch.save(model.state_dict(), path)
     logger.info(f"Model saved to {path}")
 
 def load_model(model, path='model.pth'):
     if os.path.exists(path):
+        import torch
         model.load_state_dict(torch.load(path))
         logger.info(f"Model loaded from {path}")
-
-load_model(predictor)
-load_model(q_network)
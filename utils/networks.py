@@ -0,0 +1,36 @@
+import torch.nn as nn
+import torch.nn.functional as F
+import logging
+
+logger = logging.getLogger(__name__)
+
+class TransformerPredictor(nn.Module):
+    def __init__(self, input_dim=10, d_model=64, nhead=4, num_layers=2):
+        super().__init__()
+        self.embedding = nn.Linear(input_dim, d_model)
+        self.transformer = nn.TransformerEncoder(
+            nn.TransformerEncoderLayer(d_model, nhead), num_layers
+        )
+        self.fc = nn.Linear(d_model, 1)
+
+    def forward(self, x):
+        x = self.embedding(x)
+        x = self.transformer(x.unsqueeze(1)).squeeze(1)
+        return self.fc(x.mean(dim=0, keepdim=True))
+
+    def predict_batch(self, x):
+        x = self.embedding(x)
+        x = self.transformer(x.unsqueeze(0)).squeeze(0)
+        return self.fc(x).squeeze(-1)
+
+class QNetwork(nn.Module):
+    def __init__(self, state_dim, action_dim):
+        super().__init__()
+        self.fc1 = nn.Linear(state_dim, 128)
+        self.fc2 = nn.Linear(128, 128)
+        self.fc3 = nn.Linear(128, action_dim)
+
+    def forward(self, state):
+        x = F.relu(self.fc1(state))
+        x = F.relu(self.fc2(x))
+        return self.fc3(x)
@@ -0,0 +1,119 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+import logging
+
+logger = logging.getLogger(__name__)
+
+SERIES = ('prices', 'simple_returns', 'log_returns')
+
+class PriceStore:
+    def __init__(self, directory, columns=None, capacity=4096):
+        self.directory = directory
+        self._meta_path = os.path.join(directory, 'meta.json')
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path) as f:
+                meta = json.load(f)
+            self.columns, self.length, self.capacity = meta['columns'], meta['length'], meta['capacity']
+            self._meta_stamp = self._stamp()
+        else:
+            if columns is None:
+                raise ValueError(f"No price store at {directory}; columns are required to create one")
+            os.makedirs(directory, exist_ok=True)
+            self.columns, self.length, self.capacity = list(columns), 0, capacity
+            self._allocate(capacity)
+            self._write_meta()
+        self._open()
+
+    @staticmethod
+    def exists(directory):
+        return os.path.exists(os.path.join(directory, 'meta.json'))
+
+    @classmethod
+    def from_frame(cls, directory, frame):
+        store = cls(directory, columns=frame.columns)
+        if store.length == 0:
+            store.append(frame)
+        return store
+
+    def _path(self, name):
+        return os.path.join(self.directory, f"{name}.f64" if name != 'dates' else 'dates.i8')
+
+    def _allocate(self, capacity):
+        width = len(self.columns)
+        for name in SERIES:
+            with open(self._path(name), 'ab') as f:
+                f.truncate(capacity * width * 8)
+        with open(self._path('dates'), 'ab') as f:
+            f.truncate(capacity * 8)
+
+    def _open(self):
+        shape = (self.capacity, len(self.columns))
+        self._arrays = {name: np.memmap(self._path(name), dtype=np.float64, mode='r+', shape=shape) for name in SERIES}
+        self._dates = np.memmap(self._path('dates'), dtype=np.int64, mode='r+', shape=(self.capacity,))
+
+    def _stamp(self):
+        st = os.stat(self._meta_path)
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _write_meta(self):
+        tmp = f"{self._meta_path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump({'columns': self.columns, 'length': self.length, 'capacity': self.capacity}, f)
+        os.replace(tmp, self._meta_path)
+        self._meta_stamp = self._stamp()
+
+    def _grow(self, needed):
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        for arr in self._arrays.values():
+            arr.flush()
+        self._arrays = self._dates = None
+        self._allocate(capacity)
+        self.capacity = capacity
+        self._open()
+
+    def refresh(self):
+        stamp = self._stamp()
+        if stamp == self._meta_stamp:
+            return
+        self._meta_stamp = stamp
+        with open(self._meta_path) as f:
+            meta = json.load(f)
+        if meta['capacity'] != self.capacity:
+            self.capacity = meta['capacity']
+            self._open()
+        self.length = meta['length']
+
+    def append(self, frame):
+        frame = frame.reindex(columns=self.columns)
+        new = frame.to_numpy(dtype=np.float64)
+        start, end = self.length, self.length + len(new)
+        if end > self.capacity:
+            self._grow(end)
+        prices = self._arrays['prices']
+        prices[start:end] = new
+        prev = np.vstack([prices[start - 1:start], new[:-1]]) if start else np.vstack([np.full((1, new.shape[1]), np.nan), new[:-1]])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = new / prev
+            self._arrays['simple_returns'][start:end] = ratio - 1
+            self._arrays['log_returns'][start:end] = np.log(ratio)
+        self._dates[start:end] = pd.DatetimeIndex(frame.index).as_unit('ns').asi8
+        for arr in (*self._arrays.values(), self._dates):
+            arr.flush()
+        self.length = end
+        self._write_meta()
+        logger.info(f"Appended {len(new)} rows to price store ({self.length} total)")
+
+    def view(self, name='prices'):
+        arr = self._arrays[name][:self.length]
+        arr.flags.writeable = False
+        return arr
+
+    def index(self):
+        return pd.DatetimeIndex(np.asarray(self._dates[:self.length]).view('datetime64[ns]'))
+
+    def frame(self, name='prices'):
+        return pd.DataFrame(self.view(name), index=self.index(), columns=self.columns, copy=False)
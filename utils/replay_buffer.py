@@ -0,0 +1,105 @@
+import os
+import threading
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+REPLAY_CAPACITY = int(os.getenv('REPLAY_CAPACITY', 100000))
+REPLAY_ALPHA = float(os.getenv('REPLAY_ALPHA', 0.0))
+FIELDS = ('states', 'actions', 'rewards', 'next_states')
+
+class ReplayBuffer:
+    def __init__(self, capacity, state_dim, alpha=REPLAY_ALPHA, seed=None):
+        self.capacity = capacity
+        self.state_dim = state_dim
+        self.alpha = alpha
+        self.size = 0
+        self.cursor = 0
+        self.states = np.zeros((capacity, state_dim), dtype=np.float32)
+        self.actions = np.zeros(capacity, dtype=np.int64)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.next_states = np.zeros((capacity, state_dim), dtype=np.float32)
+        self.priorities = np.zeros(capacity, dtype=np.float64)
+        self._max_priority = 1.0
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.size
+
+    def append(self, state, action, reward, next_state):
+        self.extend([state], [action], [reward], [next_state])
+
+    def extend(self, states, actions, rewards, next_states):
+        states = np.asarray(states, dtype=np.float32).reshape(-1, self.state_dim)
+        n = len(states)
+        if n == 0:
+            return
+        if n > self.capacity:
+            states, actions, rewards, next_states = (np.asarray(a)[-self.capacity:] for a in (states, actions, rewards, next_states))
+            n = self.capacity
+        with self._lock:
+            idx = (self.cursor + np.arange(n)) % self.capacity
+            self.states[idx] = states
+            self.actions[idx] = actions
+            self.rewards[idx] = rewards
+            self.next_states[idx] = np.asarray(next_states, dtype=np.float32).reshape(-1, self.state_dim)
+            self.priorities[idx] = self._max_priority
+            self.cursor = (self.cursor + n) % self.capacity
+            self.size = min(self.size + n, self.capacity)
+
+    def _indices(self, batch_size):
+        if self.alpha > 0:
+            p = self.priorities[:self.size] ** self.alpha
+            return self._rng.choice(self.size, size=batch_size, p=p / p.sum())
+        return self._rng.integers(0, self.size, size=batch_size)
+
+    def scratch(self, batch_size):
+        return {'states': np.empty((batch_size, self.state_dim), dtype=np.float32),
+                'actions': np.empty(batch_size, dtype=np.int64),
+                'rewards': np.empty(batch_size, dtype=np.float32),
+                'next_states': np.empty((batch_size, self.state_dim), dtype=np.float32)}
+
+    def sample(self, batch_size, out=None):
+        # Fresh arrays unless the caller hands in its own scratch(), which the next sample(out=...) overwrites
+        batch = self.scratch(batch_size) if out is None else out
+        with self._lock:
+            idx = self._indices(batch_size)
+            for name in FIELDS:
+                np.take(getattr(self, name), idx, axis=0, out=batch[name])
+        return (idx,) + tuple(batch[name] for name in FIELDS)
+
+    def update_priorities(self, idx, errors, eps=1e-6):
+        priorities = np.abs(np.asarray(errors, dtype=np.float64)) + eps
+        with self._lock:
+            self.priorities[idx] = priorities
+            self._max_priority = max(self._max_priority, float(priorities.max()))
+
+    def save(self, path):
+        with self._lock:
+            order = (self.cursor - self.size + np.arange(self.size)) % self.capacity
+            arrays = {name: getattr(self, name)[order] for name in ('states', 'actions', 'rewards', 'next_states', 'priorities')}
+        tmp = f"{path}.tmp"
+        with open(tmp, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+        logger.info(f"Replay buffer with {len(order)} transitions written to {path}")
+
+    def load(self, path):
+        if not os.path.exists(path):
+            return False
+        with np.load(path) as data:
+            if data['states'].shape[1:] != (self.state_dim,):
+                logger.warning(f"Ignoring replay buffer at {path}: state shape {data['states'].shape[1:]} does not match {self.state_dim}")
+                return False
+            with self._lock:
+                self.size = self.cursor = 0
+            self.extend(data['states'], data['actions'], data['rewards'], data['next_states'])
+            n = self.size
+            with self._lock:
+                if n:
+                    self.priorities[:n] = data['priorities'][-n:]
+                    self._max_priority = max(1.0, float(self.priorities[:n].max()))
+        logger.info(f"Restored {self.size} replay transitions from {path}")
+        return True
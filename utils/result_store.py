@@ -0,0 +1,262 @@
+import hashlib
+import io
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+import numpy as np
+import logging
+from utils.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+RESULT_STORE_PATH = os.getenv('RESULT_STORE_PATH', 'results.db')
+RESULT_STORE_TTL = float(os.getenv('RESULT_STORE_TTL', 6 * 3600))
+RESULT_STORE_MAX_BYTES = int(os.getenv('RESULT_STORE_MAX_BYTES', 256 * 2 ** 20))
+RESULT_STORE_HOT = int(os.getenv('RESULT_STORE_HOT', 256))
+RESULT_STORE_VERSION = os.getenv('RESULT_STORE_VERSION')
+COMPRESS_ABOVE = 4096
+PURGE_INTERVAL = 60
+SCHEMA_VERSION = 2
+SOURCE_PACKAGES = ('agents', 'core', 'utils')
+
+STORE_LOOKUPS = Counter('wealth_result_store_lookups_total', 'Persistent result store lookups by outcome', ('result',))
+
+MISSING = object()
+
+SCHEMA = """
+DROP TABLE IF EXISTS results;
+DROP TABLE IF EXISTS usage;
+CREATE TABLE results (
+    key TEXT PRIMARY KEY,
+    agent TEXT NOT NULL,
+    method TEXT NOT NULL,
+    codec TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    expires REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX results_accessed ON results (accessed);
+CREATE INDEX results_expires ON results (expires);
+CREATE TABLE usage (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL);
+INSERT INTO usage VALUES (0, 0);
+CREATE TRIGGER results_insert AFTER INSERT ON results BEGIN UPDATE usage SET bytes = bytes + NEW.size; END;
+CREATE TRIGGER results_update AFTER UPDATE OF size ON results BEGIN UPDATE usage SET bytes = bytes + NEW.size - OLD.size; END;
+CREATE TRIGGER results_delete AFTER DELETE ON results BEGIN UPDATE usage SET bytes = bytes - OLD.size; END;
+"""
+
+UPSERT = """
+INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (key) DO UPDATE SET codec = excluded.codec, payload = excluded.payload, size = excluded.size,
+    created = excluded.created, expires = excluded.expires, accessed = excluded.accessed
+"""
+
+def source_digest(root=None, packages=SOURCE_PACKAGES):
+    root = root or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    h = hashlib.blake2b(digest_size=8)
+    for package in packages:
+        directory = os.path.join(root, package)
+        for name in sorted(os.listdir(directory)) if os.path.isdir(directory) else ():
+            if name.endswith('.py'):
+                h.update(name.encode())
+                with open(os.path.join(directory, name), 'rb') as f:
+                    h.update(f.read())
+    return h.hexdigest()
+
+def _check_private(path):
+    if not os.path.exists(path):
+        os.close(os.open(path, os.O_CREAT | os.O_WRONLY, 0o600))
+    st = os.stat(path)
+    if st.st_mode & 0o022 or (hasattr(os, 'getuid') and st.st_uid != os.getuid()):
+        raise PermissionError(f"Result store {path} must be owned by this user and not group- or world-writable; "
+                              f"its entries are unpickled on read")
+
+def encode(value):
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        buf = io.BytesIO()
+        np.save(buf, value, allow_pickle=False)
+        codec, payload = 'npy', buf.getvalue()
+    else:
+        codec, payload = 'pickle', pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    if len(payload) > COMPRESS_ABOVE:
+        codec, payload = f"{codec}+zlib", zlib.compress(payload, 1)
+    return codec, payload
+
+def decode(codec, payload):
+    if codec.endswith('+zlib'):
+        codec, payload = codec[:-5], zlib.decompress(payload)
+    if codec == 'npy':
+        return np.load(io.BytesIO(payload), allow_pickle=False)
+    return pickle.loads(payload)
+
+class ResultStore:
+    def __init__(self, path=RESULT_STORE_PATH, ttl=RESULT_STORE_TTL, max_bytes=RESULT_STORE_MAX_BYTES, hot_size=RESULT_STORE_HOT,
+                 namespace=None):
+        self.path = path
+        self.namespace = f"{SCHEMA_VERSION}:{namespace or RESULT_STORE_VERSION or source_digest()}"
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hot_size = hot_size
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._hot = OrderedDict()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._purged = 0.0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        _check_private(path)
+        self._migrate()
+
+    @classmethod
+    def from_env(cls):
+        if not RESULT_STORE_PATH:
+            return None
+        try:
+            return cls()
+        except (PermissionError, sqlite3.Error) as e:
+            logger.error(f"Result store disabled: {e}")
+            return None
+
+    def _migrate(self):
+        conn = self._connect()
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if version != SCHEMA_VERSION:
+            conn.executescript(f"BEGIN IMMEDIATE; {SCHEMA} PRAGMA user_version = {SCHEMA_VERSION}; COMMIT;")
+            logger.info(f"Initialised result store schema v{SCHEMA_VERSION} (was v{version})")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def key(self, agent, method, params, fingerprint):
+        h = hashlib.blake2b(digest_size=20)
+        for part in (self.namespace, agent, method, params, fingerprint):
+            h.update(str(part).encode())
+            h.update(b'\x00')
+        return h.hexdigest()
+
+    def _remember(self, key, value, expires):
+        with self._lock:
+            self._hot[key] = (value, expires)
+            self._hot.move_to_end(key)
+            while len(self._hot) > self.hot_size:
+                self._hot.popitem(last=False)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            cached = self._hot.get(key)
+            if cached is not None and cached[1] > now:
+                self._hot.move_to_end(key)
+                self.hits += 1
+                STORE_LOOKUPS.inc(result='hot')
+                return cached[0]
+        try:
+            conn = self._connect()
+            row = conn.execute('SELECT codec, payload, expires FROM results WHERE key = ? AND expires > ?', (key, now)).fetchone()
+            if row is not None:
+                conn.execute('UPDATE results SET accessed = ? WHERE key = ?', (now, key))
+                value = decode(row[0], row[1])
+        except (sqlite3.Error, pickle.UnpicklingError, ValueError, zlib.error) as e:
+            logger.warning(f"Result store read failed for {key[:12]}: {e}")
+            row = None
+        if row is None:
+            self.misses += 1
+            STORE_LOOKUPS.inc(result='miss')
+            return MISSING
+        self.hits += 1
+        STORE_LOOKUPS.inc(result='hit')
+        self._remember(key, value, row[2])
+        return value
+
+    def put(self, key, value, agent='', method='', ttl=None):
+        try:
+            codec, payload = encode(value)
+        except Exception as e:
+            logger.debug(f"Not persisting {agent}.{method}: {e}")
+            return False
+        now = time.time()
+        expires = now + (self.ttl if ttl is None else ttl)
+        try:
+            self._connect().execute(UPSERT, (key, agent, method, codec, payload, len(payload), now, expires, now))
+        except sqlite3.Error as e:
+            logger.warning(f"Result store write failed for {agent}.{method}: {e}")
+            return False
+        self.writes += 1
+        self._remember(key, value, expires)
+        self.evict()
+        return True
+
+    def evict(self):
+        conn = self._connect()
+        now = time.time()
+        try:
+            expired = 0
+            if now - self._purged >= PURGE_INTERVAL:
+                expired = conn.execute('DELETE FROM results WHERE expires <= ?', (now,)).rowcount
+                self._purged = now
+            excess = conn.execute('SELECT bytes FROM usage').fetchone()[0] - self.max_bytes
+            victims = []
+            if excess > 0:
+                for key, size in conn.execute('SELECT key, size FROM results ORDER BY accessed'):
+                    victims.append((key,))
+                    excess -= size
+                    if excess <= 0:
+                        break
+                conn.executemany('DELETE FROM results WHERE key = ?', victims)
+        except sqlite3.Error as e:
+            logger.warning(f"Result store eviction failed: {e}")
+            return 0
+        removed = expired + len(victims)
+        if removed:
+            self.evictions += removed
+            with self._lock:
+                for (key,) in victims:
+                    self._hot.pop(key, None)
+            logger.debug(f"Evicted {removed} results ({expired} expired)")
+        return removed
+
+    def warm(self, limit=None):
+        limit = self.hot_size if limit is None else limit
+        self._purged = 0.0
+        self.evict()
+        try:
+            rows = self._connect().execute('SELECT key, codec, payload, expires FROM results WHERE expires > ? ORDER BY accessed DESC LIMIT ?',
+                                           (time.time(), limit)).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Result store warmup failed: {e}")
+            return 0
+        loaded = 0
+        for key, codec, payload, expires in reversed(rows):
+            try:
+                self._remember(key, decode(codec, payload), expires)
+                loaded += 1
+            except (pickle.UnpicklingError, ValueError, zlib.error, AttributeError, ImportError) as e:
+                logger.debug(f"Skipping unreadable result {key[:12]}: {e}")
+        logger.info(f"Warmed {loaded} results from {os.path.basename(self.path)}")
+        return loaded
+
+    def clear(self):
+        self._connect().execute('DELETE FROM results')
+        with self._lock:
+            self._hot.clear()
+
+    def stats(self):
+        conn = self._connect()
+        count, size = conn.execute('SELECT COUNT(*) FROM results').fetchone()[0], conn.execute('SELECT bytes FROM usage').fetchone()[0]
+        total = self.hits + self.misses
+        return {'entries': count, 'bytes': size, 'max_bytes': self.max_bytes, 'hot': len(self._hot), 'hits': self.hits,
+                'misses': self.misses, 'writes': self.writes, 'evictions': self.evictions, 'hit_rate': self.hits / total if total else 0.0}
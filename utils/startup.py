@@ -0,0 +1,104 @@
+import importlib.abc
+import sys
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class _TimedLoader(importlib.abc.Loader):
+    def __init__(self, loader, name, timer):
+        self.loader = loader
+        self.name = name
+        self.timer = timer
+
+    def __getattr__(self, attr):
+        return getattr(self.loader, attr)
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        module.__loader__ = self.loader
+        if module.__spec__ is not None:
+            module.__spec__.loader = self.loader
+        self.timer._stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            total = time.perf_counter() - start
+            children = self.timer._stack.pop()
+            self.timer.modules[self.name] = {'cumulative': total, 'self': total - children, 'phase': self.timer.phase}
+            if self.timer._stack:
+                self.timer._stack[-1] += total
+
+class ImportTimer(importlib.abc.MetaPathFinder):
+    def __init__(self):
+        self.modules = {}
+        self.phases = {}
+        self.phase = 'startup'
+        self._stack = []
+        self._started = time.perf_counter()
+
+    def install(self):
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                    spec.loader = _TimedLoader(spec.loader, fullname, self)
+                return spec
+        return None
+
+    def mark(self, phase):
+        self.phases[self.phase] = time.perf_counter() - self._started
+        self.phase = phase
+        self._started = time.perf_counter()
+
+    def report(self, top=25):
+        packages = {}
+        for name, t in self.modules.items():
+            root = name.split('.')[0]
+            packages[root] = packages.get(root, 0.0) + t['self']
+        slowest = sorted(self.modules.items(), key=lambda kv: kv[1]['self'], reverse=True)[:top]
+        return {
+            'phases': dict(self.phases),
+            'current_phase': self.phase,
+            'total_import_seconds': sum(t['self'] for t in self.modules.values()),
+            'packages': dict(sorted(packages.items(), key=lambda kv: kv[1], reverse=True)),
+            'modules': {name: t for name, t in slowest}
+        }
+
+import_timer = ImportTimer()
+
+def warmup(replay=None, store=None):
+    import_timer.mark('warmup')
+    from utils.graphics import load_backend
+    load_backend()
+    from utils.training import get_scheduler
+    scheduler = get_scheduler()
+    if replay is not None:
+        scheduler.attach_replay(replay)
+    scheduler.restore()
+    scheduler.start()
+    if store is not None:
+        store.warm()
+    import_timer.mark('ready')
+    logger.info(f"Warmup complete in {import_timer.phases['warmup']:.2f}s")
+
+def shutdown():
+    training = sys.modules.get(f"{__package__}.training")
+    if training is not None:
+        training.stop_scheduler()
+    optimizer = sys.modules.get('core.optimizer')
+    if optimizer is not None:
+        optimizer.stop_pool()
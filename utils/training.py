@@ -0,0 +1,210 @@
+import copy
+import hashlib
+import os
+import re
+import threading
+import torch
+import torch.nn.functional as F
+import torch.optim as optim
+import logging
+from utils.ml_models import get_models, train_predictor
+from utils.metrics import TRAINING_SECONDS
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_DIR = os.getenv('CHECKPOINT_DIR', 'checkpoints')
+TRAIN_INTERVAL = float(os.getenv('TRAIN_INTERVAL', 300))
+TRAIN_BATCH_THRESHOLD = int(os.getenv('TRAIN_BATCH_THRESHOLD', 256))
+KEEP_CHECKPOINTS = int(os.getenv('KEEP_CHECKPOINTS', 3))
+RL_BATCH_SIZE = int(os.getenv('RL_BATCH_SIZE', 64))
+
+def weights_digest(models):
+    h = hashlib.blake2b(digest_size=16)
+    for name in sorted(models):
+        for key, tensor in models[name].state_dict().items():
+            h.update(f"{name}.{key}".encode())
+            h.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    return h.hexdigest()
+
+class TrainingScheduler:
+    def __init__(self, predictor, q_network, checkpoint_dir=CHECKPOINT_DIR, interval=TRAIN_INTERVAL,
+                 batch_threshold=TRAIN_BATCH_THRESHOLD, keep=KEEP_CHECKPOINTS):
+        self.checkpoint_dir = checkpoint_dir
+        self.interval = interval
+        self.batch_threshold = batch_threshold
+        self.keep = keep
+        self.version = 0
+        self.pending = 0
+        self.replay = None
+        self._replay_batch = None
+        self._training = {'predictor': copy.deepcopy(predictor).train(), 'q_network': copy.deepcopy(q_network).train()}
+        self._serving = {'predictor': predictor.eval(), 'q_network': q_network.eval()}
+        self.digest = weights_digest(self._serving)
+        self.optimizer = optim.Adam(self._training['predictor'].parameters(), lr=0.001)
+        self.rl_optimizer = optim.Adam(self._training['q_network'].parameters(), lr=0.001)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._checkpoint_job = None
+        self._checkpoint_ready = threading.Condition()
+        self._checkpointer = None
+
+    def model(self, name):
+        return self._serving[name]
+
+    def record(self, n=1):
+        self.pending += n
+        if self.pending >= self.batch_threshold:
+            self._wake.set()
+
+    def attach_replay(self, memory):
+        if memory is not self.replay:
+            self.replay, self._replay_batch = memory, None
+
+    def _train_q_from_replay(self, batch_size=RL_BATCH_SIZE):
+        if self.replay is None or len(self.replay) < batch_size:
+            return
+        if self._replay_batch is None or len(self._replay_batch['actions']) != batch_size:
+            self._replay_batch = self.replay.scratch(batch_size)
+        idx, *batch = self.replay.sample(batch_size, out=self._replay_batch)
+        states, actions, rewards, next_states = (torch.from_numpy(a) for a in batch)
+        _, errors = self._q_step(states, actions, rewards, next_states)
+        self.replay.update_priorities(idx, errors.numpy())
+
+    def _q_step(self, states, actions, rewards, next_states, gamma=0.99):
+        net = self._training['q_network']
+        q_values = net(states).gather(1, actions.unsqueeze(1)).squeeze(1)
+        next_q = net(next_states).max(1)[0].detach()
+        targets = rewards + gamma * next_q
+        loss = F.smooth_l1_loss(q_values, targets)
+        self.rl_optimizer.zero_grad()
+        loss.backward()
+        self.rl_optimizer.step()
+        return loss.item(), (q_values - targets).detach().abs()
+
+    def step(self):
+        with self._lock:
+            with TRAINING_SECONDS.time(phase='predictor'):
+                train_predictor(self._training['predictor'], self.optimizer)
+            with TRAINING_SECONDS.time(phase='q_network'):
+                self._train_q_from_replay()
+            self.pending = 0
+            self._publish()
+        self.checkpoint()
+
+    def _publish(self, version=None):
+        serving = {name: copy.deepcopy(model).eval() for name, model in self._training.items()}
+        self.version = self.version + 1 if version is None else version
+        self.digest = weights_digest(serving)
+        self._serving = serving
+        logger.info(f"Published model weights v{self.version}")
+
+    def checkpoint(self):
+        with self._checkpoint_ready:
+            self._checkpoint_job = (self.version, self._serving)
+            if self._checkpointer is None or not self._checkpointer.is_alive():
+                self._checkpointer = threading.Thread(target=self._checkpoint_loop, name='model-checkpointer', daemon=True)
+                self._checkpointer.start()
+            self._checkpoint_ready.notify()
+
+    def _checkpoint_loop(self):
+        while True:
+            with self._checkpoint_ready:
+                while self._checkpoint_job is None and not self._stop.is_set():
+                    self._checkpoint_ready.wait()
+                job, self._checkpoint_job = self._checkpoint_job, None
+            if job is None:
+                return
+            try:
+                self._write_checkpoints(*job)
+            except Exception:
+                logger.exception(f"Checkpoint v{job[0]} failed")
+
+    def _write_checkpoints(self, version, serving):
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        for name, model in serving.items():
+            path = os.path.join(self.checkpoint_dir, f"{name}-v{version:06d}.pth")
+            tmp = f"{path}.tmp"
+            torch.save(model.state_dict(), tmp)
+            os.replace(tmp, path)
+            logger.info(f"Checkpoint written to {path}")
+            self._prune(name)
+        if self.replay is not None:
+            self.replay.save(self._replay_path())
+
+    def _replay_path(self):
+        return os.path.join(self.checkpoint_dir, 'replay.npz')
+
+    def _checkpoints(self, name):
+        if not os.path.isdir(self.checkpoint_dir):
+            return []
+        pattern = re.compile(rf"^{re.escape(name)}-v(\d+)\.pth$")
+        found = [(int(m.group(1)), f) for f in os.listdir(self.checkpoint_dir) if (m := pattern.match(f))]
+        return sorted(found)
+
+    def _prune(self, name):
+        for _, f in self._checkpoints(name)[:-self.keep]:
+            try:
+                os.remove(os.path.join(self.checkpoint_dir, f))
+            except FileNotFoundError:
+                pass
+
+    def restore(self):
+        with self._lock:
+            restored = self.version
+            for name, model in self._training.items():
+                found = self._checkpoints(name)
+                if found:
+                    version, f = found[-1]
+                    model.load_state_dict(torch.load(os.path.join(self.checkpoint_dir, f)))
+                    restored = max(restored, version)
+                    logger.info(f"Restored {name} from {f}")
+            if self.replay is not None:
+                self.replay.load(self._replay_path())
+            self._publish(restored)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.step()
+            except Exception:
+                logger.exception("Background training step failed")
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='model-trainer', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._checkpoint_ready:
+            self._checkpoint_ready.notify()
+        if self._checkpointer is not None:
+            self._checkpointer.join()
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            models = get_models()
+            _scheduler = TrainingScheduler(models['predictor'], models['q_network'])
+    return _scheduler
+
+def stop_scheduler():
+    if _scheduler is not None:
+        _scheduler.stop()
+        if _scheduler.replay is not None:
+            os.makedirs(_scheduler.checkpoint_dir, exist_ok=True)
+            _scheduler.replay.save(_scheduler._replay_path())